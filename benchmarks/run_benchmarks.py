@@ -0,0 +1,330 @@
+"""
+Benchmarks of the extraction pipeline on synthetic data (see synthetic.py).
+
+Every case runs in a fresh process so peak RSS belongs to that case alone. Results are saved as JSON and can be
+compared against an earlier run to catch regressions in the hot path.
+
+From the repository root:
+    python -m benchmarks.run_benchmarks run --grid quick --out results.json
+    python -m benchmarks.run_benchmarks run --grid quick --out new.json --baseline results.json
+    python -m benchmarks.run_benchmarks compare results.json new.json
+    python -m benchmarks.run_benchmarks cold-start --max-seconds 0.5
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+# rasters (size in pixels, data type, block layout) crossed with shapefiles (lines, length in metres, vertices)
+GRIDS = {
+    "quick": {
+        "sizes": [2048], "dtypes": ["Int16", "Float32"], "layouts": ["strip", "tiled256"],
+        "n_lines": [200, 2000], "lengths": [3000], "n_vertices": [2, 25],
+        "pixel_points": 20000,
+    },
+    "full": {
+        "sizes": [1024, 4096, 16384], "dtypes": ["Byte", "Int16", "Float32"],
+        "layouts": ["strip", "tiled256", "tiled512"],
+        "n_lines": [100, 1000, 10000], "lengths": [1000, 5000], "n_vertices": [2, 10, 100],
+        "pixel_points": 100000,
+    },
+}
+
+
+def benchmark_cases(grid):
+    """
+    function to expand a grid into the list of benchmark cases. Extractor cases cover every raster and shapefile
+    combination, pixel value cases every raster (including MEM rasters) with both the per-point pixel_values and
+    the batched sample_pixel_values.
+    :param grid: dictionary of parameter lists, one of GRIDS
+    :return: list of case dictionaries
+    """
+    cases = []
+    for size, dtype, layout in itertools.product(grid["sizes"], grid["dtypes"], grid["layouts"]):
+        for n_lines, length, n_vertices in itertools.product(grid["n_lines"], grid["lengths"], grid["n_vertices"]):
+            cases.append({"kind": "extractor", "size": size, "dtype": dtype, "layout": layout, "n_lines": n_lines,
+                          "length": length, "n_vertices": n_vertices})
+    for size, dtype, layout in itertools.product(grid["sizes"], grid["dtypes"], grid["layouts"] + ["mem"]):
+        for kind in ("pixel_values", "sample_pixel_values"):
+            cases.append({"kind": kind, "size": size, "dtype": dtype, "layout": layout,
+                          "n_points": grid["pixel_points"]})
+    for case in cases:
+        case["name"] = case_name(case)
+    return cases
+
+
+def case_name(case):
+    """
+    function to build a stable name for a case, used to match cases when comparing runs
+    :param case: case dictionary
+    :return: name string
+    """
+    raster = "{}px-{}-{}".format(case["size"], case["dtype"], case["layout"])
+    if case["kind"] == "extractor":
+        return "extractor/{}/{}lines-{}m-{}v".format(raster, case["n_lines"], case["length"], case["n_vertices"])
+    return "{}/{}/{}pts".format(case["kind"], raster, case["n_points"])
+
+
+def _peak_rss_mb():
+    """
+    helper to get the peak resident set size of the current process
+    :return: peak RSS in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1048576.0 if sys.platform == "darwin" else peak / 1024.0  # bytes on macOS, KB on Linux
+
+
+def run_case(case, data_dir, options):
+    """
+    function to run one case, meant to be called in a fresh process. GTiff inputs are expected in data_dir already
+    (see prepare_data), MEM rasters are created here before the timer starts.
+    :param case: case dictionary (see benchmark_cases)
+    :param data_dir: directory holding the synthetic rasters and shapefiles
+    :param options: dictionary of extractor options (workers, chunk_size, block_cache_mb, out_format)
+    :return: case dictionary with the measurements added
+    """
+    import numpy as np
+    from osgeo import gdal
+    from libs import raster_utils
+    from libs.general_utils import ProfileExtractor
+    from libs.output_utils import read_table
+    from benchmarks.synthetic import make_raster, shapefile_name, line_geometries, ORIGIN, PIXEL_SIZE
+
+    result = dict(case)
+    raster = make_raster(data_dir, case["size"], case["dtype"], case["layout"])  # existing GTiffs are reused
+    rss_before = _peak_rss_mb()
+    raster_utils.reset_read_counter()
+
+    if case["kind"] == "extractor":
+        shp_path = os.path.join(data_dir, shapefile_name(case["n_lines"], case["length"], case["n_vertices"],
+                                                         case["size"]))
+        out_path = os.path.join(tempfile.mkdtemp(dir=data_dir), "profiles." + options.get("out_format", "csv"))
+        extractor = ProfileExtractor(shp_path, raster, "GTiff", "line_id", "front", "front_end",
+                                     csv_out_path=out_path, tir=case["dtype"] != "Float32",
+                                     block_cache_mb=options.get("block_cache_mb"), instrument=True)
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            report = extractor.extractor(workers=options.get("workers"), chunk_size=options.get("chunk_size", 256))
+        seconds = time.perf_counter() - start
+        result["phases"] = {name: phase["seconds"] for name, phase in report["phases"].items()}
+        points = len(read_table(out_path, columns=["distance"]))
+        os.remove(out_path)
+    else:
+        source = raster if case["layout"] == "mem" else gdal.Open(raster)
+        span = case["size"] * PIXEL_SIZE
+        extent = (ORIGIN[0], ORIGIN[1] - span, ORIGIN[0] + span, ORIGIN[1])
+        # points along lines, so consecutive points fall on neighbouring pixels as they do during extraction
+        n_lines = max(case["n_points"] // 100, 1)
+        lines = line_geometries(n_lines, 99 * PIXEL_SIZE, 2, extent)
+        t = np.linspace(0.0, 1.0, 100)
+        xs = (lines[:, :1, 0] + t * (lines[:, 1:, 0] - lines[:, :1, 0])).ravel()
+        ys = (lines[:, :1, 1] + t * (lines[:, 1:, 1] - lines[:, :1, 1])).ravel()
+        start = time.perf_counter()
+        if case["kind"] == "pixel_values":
+            for x, y in zip(xs, ys):
+                raster_utils.pixel_values(x, y, source)
+        else:
+            raster_utils.sample_pixel_values(xs, ys, source, groups=np.repeat(np.arange(n_lines), t.size))
+        seconds = time.perf_counter() - start
+        points = xs.size
+
+    counts = raster_utils.reset_read_counter()
+    result.update({
+        "seconds": seconds, "points": int(points), "points_per_sec": points / seconds if seconds > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(), "rss_before_mb": rss_before,
+        "gdal_reads": counts["reads"], "bytes_read": counts["bytes"],
+    })
+    return result
+
+
+def prepare_data(cases, data_dir):
+    """
+    function to create the GTiff rasters and shapefiles of a list of cases, skipping files that already exist
+    :param cases: list of case dictionaries
+    :param data_dir: directory to write into
+    """
+    from benchmarks.synthetic import make_raster, make_shapefile
+
+    for case in cases:
+        if case["layout"] != "mem":
+            make_raster(data_dir, case["size"], case["dtype"], case["layout"])
+        if case["kind"] == "extractor":
+            make_shapefile(data_dir, case["n_lines"], case["length"], case["n_vertices"], case["size"])
+
+
+def run_benchmarks(grid_name="quick", data_dir=None, options=None, pattern=None):
+    """
+    function to run every case of a grid, each in its own process
+    :param grid_name: name of the grid in GRIDS
+    :param data_dir: directory to create the synthetic data in, reused between runs. Defaults to a temporary directory
+    :param options: dictionary of extractor options (workers, chunk_size, block_cache_mb, out_format)
+    :param pattern: only run cases whose name contains this text
+    :return: results dictionary with "meta" and "cases"
+    """
+    from osgeo import gdal
+    import numpy as np
+
+    options = options or {}
+    data_dir = data_dir or tempfile.mkdtemp(prefix="profile_bench_")
+    os.makedirs(data_dir, exist_ok=True)
+    cases = [c for c in benchmark_cases(GRIDS[grid_name]) if pattern is None or pattern in c["name"]]
+    print("creating synthetic data in {}".format(data_dir))
+    prepare_data(cases, data_dir)
+    results = []
+    context = multiprocessing.get_context("spawn")  # a forked child would start with the parent's RSS
+    for k, case in enumerate(cases):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, case, data_dir, options).result()
+        print("[{}/{}] {}: {:,.0f} points/s, peak RSS {:.0f} MB, {} reads".format(
+            k + 1, len(cases), case["name"], result["points_per_sec"] or 0, result["peak_rss_mb"],
+            result["gdal_reads"]))
+        results.append(result)
+    meta = {"grid": grid_name, "options": options, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__, "gdal": gdal.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+    return {"meta": meta, "cases": results}
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    function to compare two benchmark runs case by case
+    :param baseline: results dictionary of the earlier run
+    :param current: results dictionary of the new run
+    :param threshold: fractional drop in points/second (or rise in peak RSS or reads) counted as a regression
+    :return: list of (name, baseline points/s, current points/s, change, regressions) rows and the number of
+     regressed cases
+    """
+    before = {c["name"]: c for c in baseline["cases"]}
+    rows = []
+    n_regressed = 0
+    for case in current["cases"]:
+        old = before.get(case["name"])
+        if old is None or not old.get("points_per_sec") or not case.get("points_per_sec"):
+            continue
+        change = case["points_per_sec"] / old["points_per_sec"] - 1.0
+        regressions = []
+        if change < -threshold:
+            regressions.append("speed")
+        if case["peak_rss_mb"] > old["peak_rss_mb"] * (1.0 + threshold):
+            regressions.append("memory")
+        if old.get("gdal_reads") is not None and case.get("gdal_reads") is not None \
+                and case["gdal_reads"] > old["gdal_reads"] * (1.0 + threshold):
+            regressions.append("reads")
+        n_regressed += bool(regressions)
+        rows.append((case["name"], old["points_per_sec"], case["points_per_sec"], change, regressions))
+    return rows, n_regressed
+
+
+def print_comparison(rows):
+    """
+    function to print the output of compare_results as a table
+    :param rows: comparison rows
+    """
+    width = max([len(r[0]) for r in rows] + [4])
+    print("{:<{w}}  {:>14}  {:>14}  {:>8}".format("case", "baseline pts/s", "current pts/s", "change", w=width))
+    for name, old, new, change, regressions in rows:
+        print("{:<{w}}  {:>14,.0f}  {:>14,.0f}  {:>+7.1%}  {}".format(name, old, new, change, " ".join(regressions),
+                                                                     w=width))
+
+
+def measure_cold_start(repeats=10):
+    """
+    function to measure the startup cost of an extraction job: the bare interpreter, and a fresh process importing
+    libs.general_utils (timed from inside and outside the process). Also lists any plotting modules the import
+    pulled in, which extraction should never need.
+    :param repeats: number of fresh processes per measurement, medians are reported
+    :return: dictionary of timings in seconds and the plotting modules loaded
+    """
+    import statistics
+    import subprocess
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import time; start = time.perf_counter(); import libs.general_utils, json, sys; "
+              "print(json.dumps({'seconds': time.perf_counter() - start, 'modules': [m for m in "
+              "('pandas', 'plotly', 'dash', 'pyarrow') if m in sys.modules]}))")
+    bare, process, imports = [], [], []
+    modules = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True, cwd=root)
+        bare.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", script], check=True, cwd=root, capture_output=True, text=True)
+        process.append(time.perf_counter() - start)
+        measured = json.loads(out.stdout.strip().splitlines()[-1])
+        imports.append(measured["seconds"])
+        modules = measured["modules"]
+    return {"interpreter_seconds": statistics.median(bare), "process_seconds": statistics.median(process),
+            "import_seconds": statistics.median(imports), "plotting_modules_loaded": modules}
+
+
+def _load(path):
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the extraction pipeline on synthetic data")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run a benchmark grid")
+    run.add_argument("--grid", choices=sorted(GRIDS), default="quick")
+    run.add_argument("--out", default="benchmark_results.json", help="JSON file to save the results to")
+    run.add_argument("--data-dir", help="directory for the synthetic data, kept so later runs can reuse it")
+    run.add_argument("--filter", help="only run cases whose name contains this text")
+    run.add_argument("--workers", type=int, help="extractor worker processes")
+    run.add_argument("--chunk-size", type=int, default=256, help="lines per parallel work unit")
+    run.add_argument("--block-cache-mb", type=int, help="extractor block cache size")
+    run.add_argument("--out-format", default="csv", choices=["csv", "parquet", "arrow", "npz"])
+    run.add_argument("--baseline", help="earlier results JSON to compare against")
+    run.add_argument("--threshold", type=float, default=0.1, help="regression threshold, as a fraction")
+    compare = commands.add_parser("compare", help="compare two saved runs")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1, help="regression threshold, as a fraction")
+    cold = commands.add_parser("cold-start", help="measure the startup time of an extraction job")
+    cold.add_argument("--repeats", type=int, default=10)
+    cold.add_argument("--out", help="JSON file to save the timings to")
+    cold.add_argument("--max-seconds", type=float, help="fail if importing libs.general_utils takes longer")
+    args = parser.parse_args(argv)
+
+    if args.command == "cold-start":
+        timings = measure_cold_start(args.repeats)
+        print("interpreter {interpreter_seconds:.3f} s, import {import_seconds:.3f} s, "
+              "whole process {process_seconds:.3f} s".format(**timings))
+        if timings["plotting_modules_loaded"]:
+            print("plotting modules imported: {}".format(", ".join(timings["plotting_modules_loaded"])))
+        if args.out:
+            with open(args.out, "w") as json_file:
+                json.dump(timings, json_file, indent=2)
+        too_slow = args.max_seconds is not None and timings["import_seconds"] > args.max_seconds
+        return 1 if too_slow or timings["plotting_modules_loaded"] else 0
+
+    if args.command == "run":
+        options = {"workers": args.workers, "chunk_size": args.chunk_size, "block_cache_mb": args.block_cache_mb,
+                   "out_format": args.out_format}
+        current = run_benchmarks(args.grid, args.data_dir, options, args.filter)
+        with open(args.out, "w") as json_file:
+            json.dump(current, json_file, indent=2)
+        print("results saved to {}".format(args.out))
+        if not args.baseline:
+            return 0
+        baseline = _load(args.baseline)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    rows, n_regressed = compare_results(baseline, current, args.threshold)
+    print_comparison(rows)
+    print("{} of {} cases regressed".format(n_regressed, len(rows)))
+    return 1 if n_regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
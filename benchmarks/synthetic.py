@@ -0,0 +1,176 @@
+# script for creating synthetic rasters and shapefiles to benchmark the extraction pipeline on
+from osgeo import gdal
+from osgeo import gdal_array
+from osgeo import ogr
+from osgeo import osr
+import numpy as np
+import os
+
+EPSG = 32611
+ORIGIN = (500000.0, 4500000.0)
+PIXEL_SIZE = 10.0
+NODATA = -9999
+
+# GTiff creation options of each block layout, MEM rasters are always held as one contiguous array
+LAYOUTS = {
+    "strip": ["TILED=NO"],
+    "tiled256": ["TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256"],
+    "tiled512": ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512"],
+    "mem": None,
+}
+
+
+def raster_name(size, dtype, layout):
+    """
+    function to name a synthetic raster after its parameters
+    :param size: width and height in pixels
+    :param dtype: GDAL data type name, e.g. "Int16"
+    :param layout: block layout, one of LAYOUTS
+    :return: file name
+    """
+    return "raster_{}_{}_{}.tif".format(size, dtype, layout)
+
+
+def shapefile_name(n_lines, length, n_vertices, raster_size):
+    """
+    function to name a synthetic shapefile after its parameters
+    :param n_lines: number of lines
+    :param length: approximate length of every line in metres
+    :param n_vertices: vertices per line
+    :param raster_size: width and height in pixels of the raster the lines are placed over
+    :return: file name
+    """
+    return "vectors_{}_{}_{}_{}.shp".format(n_lines, int(length), n_vertices, raster_size)
+
+
+def _surface(size, dtype, y_off=0, rows=None, seed=0):
+    """
+    helper to create rows of a smooth surface with noise and a sprinkle of NoData pixels, scaled to suit the data
+    type (TIR-like values for integers, elevations for floats)
+    :param size: width and height of the whole raster in pixels
+    :param dtype: GDAL data type name
+    :param y_off: first row
+    :param rows: number of rows, defaults to the rest of the raster
+    :param seed: random seed
+    :return: (rows, size) array of dtype
+    """
+    rows = size - y_off if rows is None else rows
+    rng = np.random.default_rng([seed, y_off])
+    ramp = np.linspace(0.0, 1.0, size)
+    surface = np.add.outer(np.sin(ramp[y_off:y_off + rows] * 6.0), np.cos(ramp * 4.0)) * 0.25 + 0.5
+    surface += rng.normal(0.0, 0.02, (rows, size))
+    np_dtype = gdal_array.GDALTypeCodeToNumericTypeCode(gdal.GetDataTypeByName(dtype))
+    if dtype == "Byte":
+        values = np.clip(surface * 254 + 1, 1, 255)
+    elif np.issubdtype(np_dtype, np.integer):
+        values = 2500 + surface * 1000  # kelvin * 10, read with a 0.1 scale under TIR processing
+    else:
+        values = 1000 + surface * 500
+    values = values.astype(np_dtype)
+    if dtype != "Byte":
+        values[rng.random((rows, size)) < 0.01] = NODATA
+    return values
+
+
+def make_raster(out_dir, size, dtype="Int16", layout="strip", seed=0):
+    """
+    function to create a synthetic single band raster, reusing the file if it already exists
+    :param out_dir: directory to write into
+    :param size: width and height in pixels
+    :param dtype: GDAL data type name
+    :param layout: block layout, one of LAYOUTS. "mem" returns an in-memory dataset instead of a path
+    :param seed: random seed
+    :return: path of the GTiff, or the open MEM dataset for the "mem" layout
+    """
+    if layout == "mem":
+        raster = gdal.GetDriverByName("MEM").Create("", size, size, 1, gdal.GetDataTypeByName(dtype))
+    else:
+        path = os.path.join(out_dir, raster_name(size, dtype, layout))
+        if os.path.exists(path):
+            return path
+        raster = gdal.GetDriverByName("GTiff").Create(path, size, size, 1, gdal.GetDataTypeByName(dtype),
+                                                      options=LAYOUTS[layout])
+    raster.SetGeoTransform((ORIGIN[0], PIXEL_SIZE, 0.0, ORIGIN[1], 0.0, -PIXEL_SIZE))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG)
+    raster.SetProjection(srs.ExportToWkt())
+    band = raster.GetRasterBand(1)
+    if dtype != "Byte":
+        band.SetNoDataValue(NODATA)
+    # written in strips so large rasters never need a full size array of doubles
+    for y_off in range(0, size, 1024):
+        band.WriteArray(_surface(size, dtype, y_off, min(1024, size - y_off), seed), 0, y_off)
+    band.FlushCache()
+    if layout == "mem":
+        return raster
+    raster = None
+    return path
+
+
+def line_geometries(n_lines, length, n_vertices, extent, seed=0):
+    """
+    function to create random wandering lines starting inside an extent, those starting near its edge run off it
+    :param n_lines: number of lines
+    :param length: length of every line in metres, measured along the straight start to end direction
+    :param n_vertices: vertices per line, at least 2
+    :param extent: (min x, min y, max x, max y) the lines start in
+    :param seed: random seed
+    :return: (n_lines, n_vertices, 2) array of vertex coordinates
+    """
+    rng = np.random.default_rng(seed)
+    n_vertices = max(int(n_vertices), 2)
+    start = rng.uniform(extent[:2], extent[2:], (n_lines, 2))
+    angle = rng.uniform(0.0, 2 * np.pi, n_lines)
+    t = np.linspace(0.0, length, n_vertices)
+    # sideways wander, zero at both ends
+    wander = rng.normal(0.0, length * 0.02, (n_lines, n_vertices))
+    wander[:, [0, -1]] = 0.0
+    along = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    across = np.stack([-np.sin(angle), np.cos(angle)], axis=1)
+    return start[:, None, :] + t[None, :, None] * along[:, None, :] + wander[:, :, None] * across[:, None, :]
+
+
+def make_shapefile(out_dir, n_lines, length, n_vertices, raster_size, seed=0):
+    """
+    function to create a synthetic line shapefile with the fields the extractor reads (line_id, front, front_end and
+    ros, field names are kept to the 10 characters a DBF allows), reusing the file if it already exists
+    :param out_dir: directory to write into
+    :param n_lines: number of lines
+    :param length: length of every line in metres
+    :param n_vertices: vertices per line
+    :param raster_size: width and height in pixels of the raster the lines are placed over
+    :param seed: random seed
+    :return: path of the shapefile
+    """
+    path = os.path.join(out_dir, shapefile_name(n_lines, length, n_vertices, raster_size))
+    if os.path.exists(path):
+        return path
+    span = raster_size * PIXEL_SIZE
+    extent = (ORIGIN[0], ORIGIN[1] - span, ORIGIN[0] + span, ORIGIN[1])
+    lines = line_geometries(n_lines, length, n_vertices, extent, seed)
+    rng = np.random.default_rng(seed + 1)
+    front_start = rng.integers(1, 6, n_lines)
+    ros = rng.uniform(0.1, 5.0, n_lines)
+
+    shp = ogr.GetDriverByName("ESRI Shapefile").CreateDataSource(path)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG)
+    shp_lyr = shp.CreateLayer(os.path.splitext(os.path.basename(path))[0], srs, ogr.wkbLineString)
+    for name, field_type in (("line_id", ogr.OFTInteger), ("front", ogr.OFTInteger),
+                             ("front_end", ogr.OFTInteger), ("ros", ogr.OFTReal)):
+        shp_lyr.CreateField(ogr.FieldDefn(name, field_type))
+    shp_def = shp_lyr.GetLayerDefn()
+    for k in range(n_lines):
+        geom = ogr.Geometry(ogr.wkbLineString)
+        for x, y in lines[k]:
+            geom.AddPoint_2D(float(x), float(y))
+        feature = ogr.Feature(shp_def)
+        feature.SetField("line_id", k)
+        feature.SetField("front", int(front_start[k]))
+        feature.SetField("front_end", int(front_start[k]) + 1)
+        feature.SetField("ros", float(ros[k]))
+        feature.SetGeometry(geom)
+        shp_lyr.CreateFeature(feature)
+        feature = None
+    shp = None
+    return path
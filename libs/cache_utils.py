@@ -0,0 +1,104 @@
+# script for caching extracted profiles between runs
+import hashlib
+import io
+import sqlite3
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def feature_key(context, attributes, vertices):
+    """
+    function to hash one feature together with everything its sampled profile depends on
+    :param context: string describing the raster and sampling settings, shared by every feature of a run
+    :param attributes: list of the feature's attribute strings
+    :param vertices: (n, 2) array of the feature's vertices
+    :return: hex digest
+    """
+    digest = hashlib.sha1("{}|{}".format(CACHE_VERSION, context).encode("utf-8"))
+    digest.update("\x1f".join(str(a) for a in attributes).encode("utf-8"))
+    digest.update(np.ascontiguousarray(vertices, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _pack(arrays):
+    """
+    helper to serialize a profile's arrays into one blob
+    :param arrays: dictionary of column name to array
+    :return: bytes
+    """
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _unpack(blob):
+    """
+    helper to read a blob written by _pack
+    :param blob: bytes
+    :return: dictionary of column name to array
+    """
+    with np.load(io.BytesIO(blob), allow_pickle=False) as npz:
+        return {c: npz[c] for c in npz.files}
+
+
+class FeatureCache:
+    """
+    SQLite store of the sampled profile of every feature, so re-runs only sample features that are new or changed.
+    Entries are grouped by scope (e.g. the shapefile and raster paths) and keyed by feature_key, which changes when
+    the feature's geometry or attributes, the raster or the sampling settings change.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite database, created if missing
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS profiles (scope TEXT NOT NULL, key TEXT NOT NULL, "
+                          "data BLOB NOT NULL, PRIMARY KEY (scope, key))")
+
+    def load(self, scope, keys, batch_size=500):
+        """
+        Looks up cached profiles.
+        :param scope: cache scope
+        :param keys: iterable of feature keys
+        :param batch_size: keys per query, below SQLite's limit on query parameters
+        :return: dictionary of key to column arrays for the keys found
+        """
+        keys = list(set(keys))
+        found = {}
+        for i in range(0, len(keys), batch_size):
+            part = keys[i:i + batch_size]
+            rows = self.conn.execute("SELECT key, data FROM profiles WHERE scope = ? AND key IN ({})".format(
+                ",".join("?" * len(part))), [scope] + part)
+            for key, blob in rows:
+                found[key] = _unpack(blob)
+        return found
+
+    def store(self, scope, profiles):
+        """
+        Adds or replaces cached profiles.
+        :param scope: cache scope
+        :param profiles: dictionary of key to column arrays
+        """
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO profiles (scope, key, data) VALUES (?, ?, ?)",
+                                  [(scope, key, _pack(arrays)) for key, arrays in profiles.items()])
+
+    def evict(self, scope, keep):
+        """
+        Removes the entries of a scope that are not in keep, i.e. deleted features and old versions of changed ones.
+        :param scope: cache scope
+        :param keep: iterable of the keys still in use
+        :return: number of entries removed
+        """
+        keep = set(keep)
+        stale = [(scope, key) for (key,) in self.conn.execute("SELECT key FROM profiles WHERE scope = ?", (scope,))
+                 if key not in keep]
+        with self.conn:
+            self.conn.executemany("DELETE FROM profiles WHERE scope = ? AND key = ?", stale)
+        return len(stale)
+
+    def close(self):
+        self.conn.close()
@@ -1,28 +1,60 @@
 from osgeo import ogr
 from osgeo import gdalconst
 from osgeo import osr
-import csv
-from shapely.geometry import LineString
+import numpy as np
 from .raster_utils import *
-import pandas as pd
-import plotly.express as px
-import dash
-import dash_core_components as dcc
-import dash_html_components as html
-# from dash.dependencies import Input, Output
+from .vector_utils import *
+from .output_utils import open_writer, output_format, typed_column
+from .stats_utils import ProfileStats
+from .instrument_utils import instrumentation
+from .cache_utils import FeatureCache, feature_key
 import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# ways of sampling a raster in a different CRS than the shapefile (see ProfileExtractor reproject)
+REPROJECT_MODES = ("points", "vrt", "warp")
+
+
+def __getattr__(name):
+    # Plotter lives in plot_utils so extraction jobs never import pandas, plotly or dash, it is still reachable here
+    if name == "Plotter":
+        from .plot_utils import Plotter
+        return Plotter
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def _sample_chunk(raster_path, xs, ys, line_idx, block_cache_mb=None, options=None):
+    """
+    Worker for parallel extraction, opens its own handle on the raster and samples one chunk of points.
+    :param raster_path: path to the raster being sampled
+    :param xs: array of x-coordinates
+    :param ys: array of y-coordinates
+    :param line_idx: array of the line each point belongs to
+    :param block_cache_mb: memory limit of the worker's block cache, None to read windows
+    :param options: keyword arguments for sample_pixel_values (see ProfileExtractor._sample_options)
+    :return: values array, status array and the worker's read counts (see raster_utils.read_counter) for the chunk
+    """
+    reset_read_counter()
+    raster = gdal.Open(raster_path, gdalconst.GA_ReadOnly)
+    cache = BlockCache(raster, max_mb=block_cache_mb) if block_cache_mb else None
+    values, status = sample_pixel_values(xs, ys, raster, groups=line_idx, cache=cache, **(options or {}))
+    return values, status, reset_read_counter()
 
 
 class ProfileExtractor:
     """
-    A class for extracting pixel values from a raster along each vector in a shapefile. The start and end points
-    of the line are interpolated at a distance equal to the spatial resolution of the raster.
-    No data and 0 values are removed during TIR processing.
+    A class for extracting pixel values from a raster along each vector in a shapefile. Points are interpolated along
+    every vertex of the line at a distance equal to the spatial resolution of the raster.
+    No data values are removed, as are 0 values during TIR processing.
     """
 
     def __init__(self, shp_path, raster_path, raster_driver_name, shp_id_field,
                  shp_front_start_field=None, shp_front_end_field=None, desired_front=None,
-                 csv_out_path=None, tir=False):
+                 csv_out_path=None, tir=False, block_cache_mb=None, reproject="points", out_format=None,
+                 resampling="nearest", use_nodata=True, exclude_values=None, scale=None, offset=None,
+                 stats_path=None, stats_bins=256, instrument=None, cache_path=None, swath_width=None,
+                 swath_stats=("mean", "median", "max")):
         """
         The definitions for all inputs in the Profile Extractor class. This is mainly designed to work with fire spread
         vectors and vectors placed in advance of an active front location.
@@ -33,9 +65,46 @@ class ProfileExtractor:
         :param shp_front_start_field: starting fire front
         :param shp_front_end_field: ending fire front
         :param desired_front: if needed to match correct raster during TIR image processing, otherwise None
-        :param csv_out_path: out path for csv containing extracted values
+        :param csv_out_path: out path for csv (or out_format file) containing extracted values
         :param tir: set True for vector and thermal infrared imagery work, additional data cleaning and error handling
          measures will be applied.
+        :param block_cache_mb: if set, the raster is read in native blocks through an LRU cache limited to this many
+         megabytes, use for rasters too large to read in whole windows. The cache is kept on the extractor, so
+         sampling the same raster again (another extractor run, or a raster listed twice in a TimeSeriesExtractor)
+         is served from the blocks already read
+        :param reproject: how to handle a raster in a different CRS than the shapefile.
+         "points" (default) transforms only the interpolated points into the raster CRS and samples the original pixels.
+         "vrt" samples a warped VRT of the raster and "warp" a warped copy of it, both written next to the raster and
+         reused on later runs while the raster file is unchanged.
+         Values from "points" match the warped modes (nearest neighbour) except for points within about one source
+         pixel of a pixel edge, where the warped grid can pick the neighbouring source pixel.
+        :param out_format: output format, "csv", "parquet", "arrow" (Arrow IPC/Feather) or "npz". Defaults to the
+         extension of csv_out_path, CSV if it is not recognised. Parquet and Arrow need pyarrow.
+        :param resampling: "nearest", "bilinear" or "cubic" interpolation of the pixel values
+        :param use_nodata: drop points on the NoData value of the raster band
+        :param exclude_values: raw pixel values to drop, defaults to 0 under TIR processing
+        :param scale: scale factor applied to pixel values, defaults to the band scale, or 0.1 (tens of deg C to
+         deg C) under TIR processing when the band has none
+        :param offset: offset added to pixel values after scaling, defaults to the band offset
+        :param stats_path: if set, statistics per front and distance (count, mean, variance, min/max, approximate
+         percentiles and the number of values outside the histogram range) are accumulated from the written points
+         and saved to this small sidecar file, which Plotter(stats_path=...) reads for the average and percentile
+         plots
+        :param stats_bins: number of histogram bins used to approximate the percentiles
+        :param instrument: per-phase timers and counters (features read, points sampled, GDAL reads and bytes, samples
+         dropped, rows written). True to collect them, a path to also write them as a JSON report, or an
+         instrument_utils.Instrumentation for hooks and cProfile output. None (default) disables them at next to no
+         cost. The report is returned by extractor.
+        :param cache_path: if set, the sampled profile of every feature is kept in this SQLite file and re-runs only
+         sample features whose geometry or attributes changed (or all of them if the raster or sampling settings
+         changed). Entries are kept per shapefile, raster and desired_front, so runs for different fronts share the
+         file without evicting each other. Entries of deleted features are removed, and the output is identical to a
+         run without the cache.
+        :param swath_width: if set, the raster is also sampled across a swath of this width (shapefile units)
+         perpendicular to the line at every point, at the interpolation spacing, and the swath_stats of each swath are
+         written as swath_<stat> columns with swath_count, the number of valid samples. pixel_val stays the value at
+         the line itself.
+        :param swath_stats: swath statistics to write, any of "mean", "median", "min", "max" and "std"
         """
 
         self.shp_path = shp_path
@@ -47,6 +116,24 @@ class ProfileExtractor:
         self.desired_front = desired_front
         self.csv_out_path = csv_out_path
         self.tir = tir
+        self.block_cache_mb = block_cache_mb
+        self._block_caches = OrderedDict()
+        if reproject not in REPROJECT_MODES:
+            raise ValueError("Unknown reproject mode: {!r}, expected one of {}".format(
+                reproject, ", ".join(REPROJECT_MODES)))
+        self.reproject = reproject
+        self.out_format = out_format
+        self.resampling = resampling
+        self.use_nodata = use_nodata
+        self.exclude_values = exclude_values
+        self.scale = scale
+        self.offset = offset
+        self.stats_path = stats_path
+        self.stats_bins = stats_bins
+        self.instrument = instrumentation(instrument)
+        self.cache_path = cache_path
+        self.swath_width = swath_width
+        self.swath_stats = tuple(swath_stats)
 
     def print_shp_fields(self):
         """
@@ -68,262 +155,651 @@ class ProfileExtractor:
         print(shp_fields)
         print("EPSG: {}".format(shp_epsg_num))
 
-    def extractor(self):
+    def extractor(self, workers=None, chunk_size=256):
         """
         A function to extract pixel values from the input raster and shapefile features
         If self.TIR is True, the TIR processing will be done.
             No data and 0 values will not be included in output shapefile under TIR.
         else: the regular raster processing occurs.
         The Python Geospatial Analysis Cookbook by Michael Diener (2015) was used as a reference for
-        concepts on how to create an elevation profile and was the impetus for using Shapely to interpolate LineStrings.
+        concepts on how to create an elevation profile.
         (url: https://subscription.packtpub.com/book/big_data_and_business_intelligence/9781783555079/7/ch07lvl1sec52/creating-an-elevation-profile)
-        :return: outputs a CSV of point values in desired output directory
+        Lines are interpolated with NumPy (see vector_utils.densify_lines), so the spatial resolution of the raster does
+        not need to be an integer.
+        :param workers: number of worker processes to sample with, None or 1 for serial processing. Each worker opens
+         its own handle on the raster and the output is identical to serial mode row for row.
+        :param chunk_size: number of lines per parallel work unit, lines are grouped so each chunk covers a compact area
+        :return: outputs a CSV (or out_format file) of point values in desired output directory, returns the
+         instrumentation report if instrument is set
+        """
+        instrument = self.instrument
+        instrument.start()
+        # setting up shapefile
+        with instrument.phase("open_shapefile"):
+            shp_driver = ogr.GetDriverByName('ESRI Shapefile')
+            path = self.shp_path
+            shp = shp_driver.Open(path, 0)
+            shp_lyr = shp.GetLayer()
+            shp_epsg = shp_lyr.GetSpatialRef()
+
+        with instrument.phase("open_raster"):
+            raster, sample_path, transform = self._open_raster(self.raster_path, shp_epsg)
+
+            # getting x,y of raster
+            interp_dist = self._interp_dist(raster, shp_epsg if transform else None)
+        print("raster loaded")
+
+        if self.tir:  # this option implies they're looking for profiles in advance of one front
+            print("TIR Profile Vector Processing")
+        else:
+            print("Regular Vector Processing")
+        with instrument.phase("read_features"):
+            rect = self._raster_rect(raster, shp_epsg, transform, interp_dist)
+            shp_pts = self._read_features(shp_lyr, rect)
+
+        sample_args = (raster, sample_path, transform, interp_dist, rect, workers, chunk_size)
+        if self.cache_path:
+            line_idx, points = self._cached_profiles(shp_pts, shp_epsg, *sample_args)
+        else:
+            line_idx, points = self._profiles(shp_pts, *sample_args)
+
+        with instrument.phase("write"):
+            batch = self._batch(self._attribute_arrays(shp_pts), line_idx, points)
+            writer = open_writer(self.csv_out_path, self._fields() + self._point_columns(), self.out_format)
+            writer.write_batch(batch)
+            writer.close()
+        instrument.count("rows_written", line_idx.size)
+
+        if self.stats_path:
+            with instrument.phase("stats"):
+                # the sampled values are all in memory, so their own range sizes the histogram
+                values = batch["pixel_val"]
+                value_range = (values.min(), values.max()) if values.size else self._value_range(raster)
+                stats = ProfileStats(interp_dist, value_range, n_hist_bins=self.stats_bins)
+                stats.update(batch["front_start"], batch["distance"], batch["pixel_val"])
+                self._write_stats(stats)
+        return instrument.finish()
+
+    def _profiles(self, shp_pts, raster, sample_path, transform, interp_dist, rect, workers=None, chunk_size=256):
+        """
+        Interpolates points along the features and samples the raster at them, dropping points that are off the
+        raster, NoData or excluded values.
+        :param shp_pts: features from _read_features
+        :param raster: opened GDAL raster
+        :param sample_path: path of the opened raster
+        :param transform: shapefile to raster coordinate transformation, or None
+        :param interp_dist: interpolation distance
+        :param rect: raster extent in shapefile units, lines are only densified where they cross it
+        :param workers: number of worker processes, None or 1 for serial processing
+        :param chunk_size: number of lines per parallel work unit
+        :return: array of the feature index of the kept points, and dictionary of their _point_columns() arrays
+        """
+        instrument = self.instrument
+        with instrument.phase("densify"):
+            lines = [line[-1] for line in shp_pts]
+            line_idx, dists, xs, ys = densify_lines(lines, interp_dist, clip=clip_to_rect(lines, rect))
+        instrument.count("points_interpolated", xs.size)
+        z_pts, status, swath = self._sample_profile(raster, sample_path, transform, lines, line_idx, dists, xs, ys,
+                                                    interp_dist, workers, chunk_size)
+        keep, z_pts = self._clean_values(z_pts, status)
+        points = {"distance": dists[keep], "x": xs[keep], "y": ys[keep], "pixel_val": z_pts}
+        points.update({name: values[keep] for name, values in swath.items()})
+        return line_idx[keep], points
+
+    def _sample_profile(self, raster, sample_path, transform, lines, line_idx, dists, xs, ys, interp_dist,
+                        workers=None, chunk_size=256):
+        """
+        Samples the raster at the interpolated points. With swath_width set, a row of points across the line is
+        sampled at every point as well (the read groups stay one per line, so each line is still read through one
+        window) and reduced to the swath statistics in NumPy.
+        :param raster: opened GDAL raster
+        :param sample_path: path of the opened raster
+        :param transform: shapefile to raster coordinate transformation, or None
+        :param lines: list of vertex arrays the points were interpolated along
+        :param line_idx: array of the line each point belongs to
+        :param dists: array of distances along the line
+        :param xs: array of x-coordinates, in shapefile units
+        :param ys: array of y-coordinates, in shapefile units
+        :param interp_dist: interpolation distance, also the spacing of the points across the swath
+        :param workers: number of worker processes, None or 1 for serial processing
+        :param chunk_size: number of lines per parallel work unit
+        :return: values and status of the interpolated points, and dictionary of swath statistic arrays (empty
+         without swath_width)
+        """
+        instrument = self.instrument
+        if not self.swath_width:
+            with instrument.phase("reproject_points"):
+                raster_xs, raster_ys = reproject_points(xs, ys, transform) if transform else (xs, ys)
+            with instrument.phase("sample"):
+                z_pts, status = self._sample_points(raster, sample_path, line_idx, raster_xs, raster_ys, workers,
+                                                    chunk_size)
+            return z_pts, status, {}
+
+        with instrument.phase("swath_grid"):
+            dx, dy = line_directions(lines, line_idx, dists)
+            grid_x, grid_y, offsets = swath_points(xs, ys, dx, dy, self.swath_width, interp_dist)
+        instrument.count("swath_points", grid_x.size)
+        with instrument.phase("reproject_points"):
+            grid_x, grid_y = reproject_points(grid_x.ravel(), grid_y.ravel(), transform) if transform else \
+                (grid_x.ravel(), grid_y.ravel())
+        with instrument.phase("sample"):
+            values, status = self._sample_points(raster, sample_path, np.repeat(line_idx, offsets.size), grid_x,
+                                                 grid_y, workers, chunk_size)
+        values = values.reshape(-1, offsets.size)
+        status = status.reshape(-1, offsets.size)
+        with instrument.phase("swath_reduce"):
+            swath = swath_statistics(values, status == SAMPLE_OK, self.swath_stats)
+        centre = offsets.size // 2  # offset 0, the interpolated point itself
+        return values[:, centre], status[:, centre], swath
+
+    def _cached_profiles(self, shp_pts, shp_srs, raster, sample_path, transform, interp_dist, rect, workers=None,
+                         chunk_size=256):
+        """
+        Same as _profiles, but only features that are not in the cache at cache_path are sampled. Profiles of the
+        new features are added to the cache and entries of features no longer in the shapefile are evicted. The
+        cache scope includes the attribute filter, so features skipped only by this run's desired_front keep their
+        entries. Features outside the raster extent only change with the raster, which changes every key anyway.
+        Lines are interpolated independently of each other (see vector_utils.densify_lines), so the result is
+        identical to sampling every feature.
+        :param shp_pts: features from _read_features
+        :param shp_srs: osr.SpatialReference of the shapefile
+        :return: array of the feature index of the kept points, and dictionary of their _point_columns() arrays
+        """
+        fingerprint = raster_fingerprint(self.raster_path, raster)
+        if fingerprint is None:
+            print("{} has no files to check for changes, sampling without the cache".format(self.raster_path))
+            return self._profiles(shp_pts, raster, sample_path, transform, interp_dist, rect, workers, chunk_size)
+        context = "|".join([fingerprint, self.reproject, shp_srs.ExportToWkt(),
+                            repr(interp_dist), repr(tuple(float(v) for v in rect)),
+                            repr(sorted(self._sample_options(raster).items())),
+                            repr((self.swath_width, tuple(self.swath_stats)))])
+        keys = [feature_key(context, line[:-1], line[-1]) for line in shp_pts]
+        scope = "{}|{}|{}".format(os.path.abspath(self.shp_path), os.path.abspath(self.raster_path),
+                                  self._attribute_filter())
+
+        cache = FeatureCache(self.cache_path)
+        try:
+            with self.instrument.phase("cache_load"):
+                profiles = cache.load(scope, keys)
+            missing = [i for i, key in enumerate(keys) if key not in profiles]
+            print("{} of {} features found in the cache, sampling {}".format(
+                len(keys) - len(missing), len(keys), len(missing)))
+            self.instrument.count("cache_hits", len(keys) - len(missing))
+            self.instrument.count("cache_misses", len(missing))
+
+            line_idx, points = self._profiles([shp_pts[i] for i in missing], raster, sample_path, transform,
+                                              interp_dist, rect, workers, chunk_size)
+            bounds = np.searchsorted(line_idx, np.arange(len(missing) + 1))
+            new = {}
+            for j, i in enumerate(missing):
+                part = slice(bounds[j], bounds[j + 1])
+                new[keys[i]] = {name: values[part] for name, values in points.items()}
+            with self.instrument.phase("cache_store"):
+                cache.store(scope, new)
+                self.instrument.count("cache_evicted", cache.evict(scope, keys))
+        finally:
+            cache.close()
+        profiles.update(new)
+
+        # reassembled in feature order, as a full run writes them
+        parts = [profiles[key] for key in keys]
+        line_idx = np.repeat(np.arange(len(keys)), [p["distance"].size for p in parts])
+        for name, sampled in points.items():
+            arrays = [p[name] for p in parts if p[name].size]  # empty profiles would change the dtype of the result
+            points[name] = np.concatenate(arrays) if arrays else sampled[:0]
+        return line_idx, points
+
+    def _fields(self):
+        """
+        :return: names of the feature attribute columns written for every point
+        """
+        if self.tir:
+            return ["line_id", "front_start"]
+        return ["line_id", "front_start", "front_end", "ros"]
+
+    def _typed_output(self):
+        """
+        :return: True if the output format stores typed columns (everything but CSV, which writes the strings)
+        """
+        return output_format(self.csv_out_path, self.out_format) != "csv"
+
+    def _attribute_arrays(self, shp_pts):
+        """
+        One value per feature for every attribute column, indexed by the line of each point in _batch. For the typed
+        output formats they are typed once from every feature (see output_utils.typed_column), so all batches share
+        the same types and no per point strings are parsed.
+        :param shp_pts: features from _read_features
+        :return: dictionary of column name to array, in the order of _fields()
+        """
+        arrays = {}
+        for c, field in enumerate(self._fields()):
+            values = [line[c] for line in shp_pts]
+            arrays[field] = typed_column(values) if self._typed_output() else np.array(values, dtype=object)
+        return arrays
+
+    def _point_columns(self):
+        """
+        :return: names of the per point columns, the swath statistics follow pixel_val when swath_width is set
+        """
+        columns = ["distance", "x", "y", "pixel_val"]
+        if self.swath_width:
+            columns += ["swath_" + stat for stat in self.swath_stats] + ["swath_count"]
+        return columns
+
+    def _batch(self, attributes, line_idx, points):
+        """
+        Builds the output columns for a set of sampled points, repeating each line's attributes for its points.
+        :param attributes: per feature attribute arrays from _attribute_arrays
+        :param line_idx: array of the line each point belongs to
+        :param points: dictionary of the point columns (distance, x, y, pixel_val and any swath statistics)
+        :return: dictionary of column name to array, in the order of _fields() followed by the point columns
+        """
+        batch = {field: values[line_idx] for field, values in attributes.items()}
+        batch.update(points)
+        return batch
+
+    def _open_raster(self, raster_path, shp_srs):
+        """
+        Opens a raster and prepares it for sampling with shapefile coordinates (see the reproject option).
+        :param raster_path: path to input raster image
+        :param shp_srs: osr.SpatialReference of the shapefile
+        :return: opened GDAL raster, the path it was opened from and the shapefile to raster coordinate
+         transformation (None if points can be sampled as they are)
         """
         # setting up raster based on inputs and raster type
         raster_driver = gdal.GetDriverByName(self.raster_driver_name)
         raster_driver.Register()
-        raster = gdal.Open(self.raster_path, gdalconst.GA_ReadOnly)
+        raster = gdal.Open(raster_path, gdalconst.GA_ReadOnly)
         raster_proj = osr.SpatialReference(wkt=raster.GetProjection())
         raster_proj_num = raster_proj.GetAttrValue("Authority", 1)
+        shp_epsg_num = shp_srs.GetAttrValue("Authority", 1)
+        if raster_proj_num == shp_epsg_num:
+            return raster, raster_path, None
 
-        # setting up shapefile
-        shp_driver = ogr.GetDriverByName('ESRI Shapefile')
-        path = self.shp_path
-        shp = shp_driver.Open(path, 0)
-        shp_lyr = shp.GetLayer()
-        shp_epsg = shp_lyr.GetSpatialRef()
-        shp_epsg_num = shp_epsg.GetAttrValue("Authority", 1)
-        # print(shp_epsg_num)
-
-        # checking CRS and reprojecting raster and redefining raster variable if needed
-        if raster_proj_num != shp_epsg_num:
-            start_end = os.path.split(self.raster_path)
-            start_path = start_end[0]
-            end_path = "EPSG_" + str(shp_epsg_num) + "_" + start_end[1]
-            out_reproj_path = os.path.join(start_path, end_path)
-            gdal.Warp(out_reproj_path, self.raster_path, dstSRS=("EPSG:" + str(shp_epsg_num)))
-            raster = gdal.Open(out_reproj_path, gdalconst.GA_ReadOnly)
-            print("{} reprojected to EPSG: {}".format(self.raster_path, shp_epsg_num))
-
-        # getting x,y of raster
-        geo_trans = raster.GetGeoTransform()
-        px_w = geo_trans[1]
-        if not px_w.is_integer():
-            print("WARNING: Shapely interpolation module requires integer input. "
-                  "{} spatial resolution ({}) is not an integer. Spatial resolution "
-                  "will be rounded to nearest integer; "
-                  "consider resampling raster to ensure accurate results.".format(self.raster_path, px_w))
-
-        interp_dist = int(abs(px_w))
-        shp_features = shp_lyr.GetNextFeature()
-        shp_pts = []
-        print("raster loaded")
-
-        if self.tir:  # this option implies they're looking for profiles in advance of one front
-            print("TIR Profile Vector Processing")
-            while shp_features:
-                front_start = shp_features.GetFieldAsString(self.shp_front_start_field)
-                shp_geom = shp_features.GetGeometryRef()
-                fp = shp_geom.GetPoint(0)
-                lp = shp_geom.GetPoint(1)
-                line_id = shp_features.GetFieldAsString(self.shp_id_field)
-                if int(front_start) == int(self.desired_front):
-                    shp_pts.append([line_id, front_start, [fp, lp]])
-                shp_features.Destroy()
-                shp_features = shp_lyr.GetNextFeature()
-
-            with open(self.csv_out_path, "w", newline="", encoding="utf-8-sig") as out_csv:
-                to_csv = csv.writer(out_csv, quoting=csv.QUOTE_NONE)
-                to_csv.writerow(["line_id", "front_start", "distance", "x", "y", "pixel_val"])
-                for line in shp_pts:
-                    ls = LineString(line[2])
-                    for i in range(0, int(ls.length), interp_dist):
-                        interp = ls.interpolate(i)
-                        x_pt, y_pt = interp.x, interp.y
-                        z_pt = pixel_values(x_pt, y_pt, raster)  # TIR raster in tens deg C, divide by 10 for deg C
-                        try:  # this removes zero values in the TIR imagery
-                            if z_pt[0][0] != 0:
-                                to_csv.writerow([line[0], line[1], i, x_pt, y_pt, (*z_pt[0] / 10)])
-                        except TypeError:
-                            print("No data for point index/location ({}, {})".format(x_pt, y_pt))
-                out_csv.close()
+        if self.reproject == "points":
+            print("{} sampled in its own CRS (EPSG: {}), points reprojected from EPSG: {}".format(
+                raster_path, raster_proj_num, shp_epsg_num))
+            return raster, raster_path, point_transform(shp_srs, raster_proj)
 
+        # reprojecting raster and redefining raster variable, reusing an earlier copy if there is one
+        out_reproj_path = warp_cache_path(raster_path, shp_epsg_num, ext=".vrt" if self.reproject == "vrt" else None)
+        if os.path.exists(out_reproj_path):
+            print("{} reusing reprojected copy {}".format(raster_path, out_reproj_path))
+        elif self.reproject == "vrt":
+            gdal.Warp(out_reproj_path, raster_path, format="VRT", dstSRS=("EPSG:" + str(shp_epsg_num)))
+            print("{} reprojected to EPSG: {} as VRT".format(raster_path, shp_epsg_num))
         else:
-            print("Regular Vector Processing")
-            while shp_features:
-                shp_geom = shp_features.GetGeometryRef()
-                fp = shp_geom.GetPoint(0)
-                lp = shp_geom.GetPoint(1)
-                line_id = shp_features.GetFieldAsString(self.shp_id_field)
-                front_start = shp_features.GetFieldAsString(self.shp_front_start_field)
+            gdal.Warp(out_reproj_path, raster_path, dstSRS=("EPSG:" + str(shp_epsg_num)))
+            print("{} reprojected to EPSG: {}".format(raster_path, shp_epsg_num))
+        raster = gdal.Open(out_reproj_path, gdalconst.GA_ReadOnly)
+        return raster, out_reproj_path, None
+
+    @staticmethod
+    def _interp_dist(raster, shp_srs=None):
+        """
+        Spacing of the interpolated points in shapefile units, equal to the spatial resolution of the raster.
+        :param raster: opened GDAL raster
+        :param shp_srs: osr.SpatialReference of the shapefile when points are reprojected to the raster CRS, else None
+        :return: interpolation distance
+        """
+        geo_trans = raster.GetGeoTransform()
+        if shp_srs is None:
+            return abs(geo_trans[1])
+        # size of the centre pixel in shapefile units, from the length of its diagonal (as gdal.Warp would choose)
+        to_shp = point_transform(osr.SpatialReference(wkt=raster.GetProjection()), shp_srs)
+        col, row = raster.RasterXSize // 2, raster.RasterYSize // 2
+        corner_x = geo_trans[0] + np.array([col, col + 1]) * geo_trans[1] + np.array([row, row + 1]) * geo_trans[2]
+        corner_y = geo_trans[3] + np.array([col, col + 1]) * geo_trans[4] + np.array([row, row + 1]) * geo_trans[5]
+        shp_x, shp_y = reproject_points(corner_x, corner_y, to_shp)
+        return float(np.hypot(shp_x[1] - shp_x[0], shp_y[1] - shp_y[0]) / np.sqrt(2))
+
+    def _read_features(self, shp_lyr, rect=None):
+        """
+        Reads the attributes and vertices of every feature. Under TIR processing only features whose start front
+        matches desired_front are kept (all features if desired_front is None). Both this (see _attribute_filter) and
+        the rect filter are passed to OGR as attribute/spatial filters, so features that fail them are never read
+        into Python.
+        :param shp_lyr: OGR layer of the shapefile
+        :param rect: optional (min x, min y, max x, max y) in shapefile units, features not touching it are skipped
+        :return: list of [attribute values..., vertex array] per feature, attributes ordered as in _fields()
+        """
+        where = self._attribute_filter()
+        if where is not None:
+            shp_lyr.SetAttributeFilter(where)
+        if rect is not None:
+            shp_lyr.SetSpatialFilterRect(*rect)
+        shp_pts = []
+        n_read = 0
+        shp_features = shp_lyr.GetNextFeature()
+        while shp_features:
+            n_read += 1
+            shp_geom = shp_features.GetGeometryRef()
+            line_id = shp_features.GetFieldAsString(self.shp_id_field)
+            front_start = shp_features.GetFieldAsString(self.shp_front_start_field)
+            if self.tir:
+                if self.desired_front is None or int(front_start) == int(self.desired_front):
+                    shp_pts.append([line_id, front_start, line_vertices(shp_geom)])
+            else:
                 front_end = shp_features.GetFieldAsString(self.shp_front_end_field)
                 ros = shp_features.GetFieldAsString("ros")
-                shp_pts.append([line_id, front_start, front_end, ros, [fp, lp]])
-                shp_features.Destroy()
-                shp_features = shp_lyr.GetNextFeature()
-
-            with open(self.csv_out_path, "w", newline="", encoding="utf-8-sig") as out_csv:
-                to_csv = csv.writer(out_csv, quoting=csv.QUOTE_NONE)
-                to_csv.writerow(["line_id", "front_start", "front_end", "ros", "distance", "x", "y", "pixel_val"])
-                for line in shp_pts:
-                    ls = LineString(line[4])
-                    for i in range(0, int(ls.length), interp_dist):
-                        interp = ls.interpolate(i)
-                        x_pt, y_pt = interp.x, interp.y
-                        z_pt = pixel_values(x_pt, y_pt, raster)
-                        to_csv.writerow([line[0], line[1], line[2], line[3], i, x_pt, y_pt, *z_pt[0]])
-                out_csv.close()
-
-
-class Plotter:
+                shp_pts.append([line_id, front_start, front_end, ros, line_vertices(shp_geom)])
+            shp_features.Destroy()
+            shp_features = shp_lyr.GetNextFeature()
+        shp_lyr.SetAttributeFilter(None)
+        shp_lyr.SetSpatialFilter(None)
+        if self.instrument.enabled:
+            self.instrument.count("features_total", shp_lyr.GetFeatureCount())
+            self.instrument.count("features_read", n_read)
+            self.instrument.count("features_kept", len(shp_pts))
+        return shp_pts
+
+    def _attribute_filter(self):
+        """
+        :return: OGR attribute filter (SQL WHERE clause) selecting the features to read, None to read all of them
+        """
+        if self.tir and self.desired_front is not None:
+            return '"{}" = {}'.format(self.shp_front_start_field, int(self.desired_front))
+        return None
+
+    @staticmethod
+    def _raster_rect(raster, shp_srs, transform=None, pad=0.0):
+        """
+        Extent of a raster in shapefile units, used to filter and clip the features.
+        :param raster: opened GDAL raster
+        :param shp_srs: osr.SpatialReference of the shapefile
+        :param transform: shapefile to raster coordinate transformation from _open_raster, or None
+        :param pad: distance added on every side, so points right at the edge are still sampled
+        :return: (min x, min y, max x, max y)
+        """
+        to_shp = None
+        if transform is not None:
+            to_shp = point_transform(osr.SpatialReference(wkt=raster.GetProjection()), shp_srs)
+        min_x, min_y, max_x, max_y = raster_bounds(raster, to_shp)
+        return min_x - pad, min_y - pad, max_x + pad, max_y + pad
+
+    def _sample_options(self, raster):
+        """
+        Sampling settings for a raster, filling in the TIR defaults.
+        :param raster: opened GDAL raster
+        :return: keyword arguments for sample_pixel_values
+        """
+        band = raster.GetRasterBand(1)
+        scale = self.scale
+        if scale is None and self.tir and band.GetScale() in (None, 1.0) and not band.GetOffset():
+            scale = 0.1  # TIR raster in tens deg C, divide by 10 for deg C
+        exclude_values = self.exclude_values
+        if exclude_values is None and self.tir:
+            exclude_values = (0,)  # this removes zero values in the TIR imagery
+        return {"method": self.resampling, "use_nodata": self.use_nodata, "exclude_values": exclude_values,
+                "scale": scale, "offset": self.offset}
+
+    def _value_range(self, raster):
+        """
+        Approximate range of the (scaled) pixel values of a raster (from overviews or a subsample, so no full scan
+        of the raster), used to size the histogram of the running statistics. Values outside it, including
+        interpolation overshoot, are counted in the tail bins of ProfileStats.
+        :param raster: opened GDAL raster
+        :return: (min, max)
+        """
+        band = raster.GetRasterBand(1)
+        options = self._sample_options(raster)
+        scale = options["scale"] if options["scale"] is not None else band.GetScale()
+        offset = options["offset"] if options["offset"] is not None else band.GetOffset()
+        low_high = apply_scale(np.array(band.ComputeRasterMinMax(True), dtype=np.float64),
+                               1.0 if scale is None else scale, 0.0 if offset is None else offset)
+        return low_high.min(), low_high.max()
+
+    def _write_stats(self, stats):
+        """
+        Writes the running statistics to stats_path.
+        :param stats: ProfileStats
+        """
+        table = stats.table()
+        writer = open_writer(self.stats_path, list(table))
+        writer.write_batch(table)
+        writer.close()
+        print("statistics written to {}".format(self.stats_path))
+
+    def _clean_values(self, z_pts, status):
+        """
+        Drops points that are off the raster, NoData or excluded values and prints a summary of what was dropped.
+        :param z_pts: sampled values
+        :param status: status array from sample_pixel_values
+        :return: mask of the points to keep and the kept values
+        """
+        keep = status == SAMPLE_OK
+        dropped = sample_summary(status)
+        if self.instrument.enabled:
+            self.instrument.count("points_sampled", keep.size)
+            self.instrument.count("samples_dropped", keep.size - np.count_nonzero(keep))
+            for name, count in dropped.items():
+                self.instrument.count("dropped_" + name.replace(" ", "_"), count)
+        if not keep.all():
+            print("{} of {} points dropped ({})".format(keep.size - np.count_nonzero(keep), keep.size, ", ".join(
+                "{}: {}".format(name, count) for name, count in dropped.items() if count)))
+        return keep, z_pts[keep]
+
+    def _block_cache(self, raster, raster_path):
+        """
+        Block cache of a raster, one per raster (by raster_fingerprint, or by dataset for rasters without files) kept
+        across calls so blocks read for one sample of the raster are reused by the next.
+        :param raster: opened GDAL raster
+        :param raster_path: path of the opened raster
+        :return: BlockCache, or None without block_cache_mb
+        """
+        if not self.block_cache_mb:
+            return None
+        key = raster_fingerprint(raster_path, raster) or id(raster)  # the cache holds the dataset, so the id is unique
+        cache = self._block_caches.pop(key, None)
+        if cache is None:
+            cache = BlockCache(raster, max_mb=self.block_cache_mb)
+        self._block_caches[key] = cache  # most recently used last
+        return cache
+
+    def _trim_block_caches(self):
+        """
+        Drops the caches of the least recently used rasters while all caches together hold more than block_cache_mb.
+        """
+        max_bytes = int(self.block_cache_mb * 1024 * 1024)
+        while len(self._block_caches) > 1 and sum(c.nbytes for c in self._block_caches.values()) > max_bytes:
+            self._block_caches.popitem(last=False)
+
+    def _sample_points(self, raster, raster_path, line_idx, xs, ys, workers=None, chunk_size=256):
+        """
+        Samples the raster at every interpolated point, serially or spread across worker processes.
+        :param raster: opened GDAL raster
+        :param raster_path: path of the opened raster, re-opened by each worker
+        :param line_idx: array of the line each point belongs to
+        :param xs: array of x-coordinates
+        :param ys: array of y-coordinates
+        :param workers: number of worker processes, None or 1 for serial processing
+        :param chunk_size: number of lines per parallel work unit
+        :return: values array and status array (see sample_pixel_values), in the same order as the input points
+        """
+        options = self._sample_options(raster)
+        if not workers or workers <= 1 or xs.size == 0:
+            cache = self._block_cache(raster, raster_path)
+            if cache is None:
+                return sample_pixel_values(xs, ys, raster, groups=line_idx, **options)
+            hits, misses = cache.hits, cache.misses
+            z_pts, status = sample_pixel_values(xs, ys, raster, groups=line_idx, cache=cache, **options)
+            print("block cache: {} hits, {} misses, {blocks} blocks ({bytes} bytes) held".format(
+                cache.hits - hits, cache.misses - misses, **cache.stats()))
+            self._trim_block_caches()
+            return z_pts, status
+
+        # chunks are built from the mean point of each line so neighbouring lines land in the same worker
+        n_lines = int(line_idx.max()) + 1
+        counts = np.bincount(line_idx, minlength=n_lines)
+        sampled = np.flatnonzero(counts)
+        mean_x = np.bincount(line_idx, xs, n_lines)[sampled] / counts[sampled]
+        mean_y = np.bincount(line_idx, ys, n_lines)[sampled] / counts[sampled]
+        line_chunk = np.zeros(n_lines, dtype=np.int64)
+        for k, chunk in enumerate(spatial_chunks(mean_x, mean_y, chunk_size)):
+            line_chunk[sampled[chunk]] = k
+        point_chunk = line_chunk[line_idx]
+        order = np.argsort(point_chunk, kind="stable")
+        parts = np.split(order, np.flatnonzero(np.diff(point_chunk[order])) + 1)
+
+        z_pts = None
+        status = np.zeros(xs.shape, dtype=np.uint8)
+        print("sampling {} chunks with {} workers".format(len(parts), workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [(part, pool.submit(_sample_chunk, raster_path, xs[part], ys[part], line_idx[part],
+                                       self.block_cache_mb, options)) for part in parts]
+            for part, job in jobs:
+                values, part_status, counts = job.result()
+                for key, n in counts.items():
+                    read_counter[key] += n
+                if z_pts is None:
+                    z_pts = np.zeros(xs.shape, dtype=values.dtype)
+                z_pts[part] = values
+                status[part] = part_status
+        return z_pts, status
+
+
+class TimeSeriesExtractor(ProfileExtractor):
     """
-    This class is used to generate the interactive dashboard and data visualizations.
+    A class for extracting profiles from a sequence of rasters (e.g. successive TIR passes over a fire) with one
+    shapefile. The shapefile is read and its lines are interpolated once, every raster is then sampled at the same
+    points and all results are written to a single long-format CSV with a raster column.
     """
 
-    def __init__(self, input_csv, x, y, color, grouping, hover, title, subtitle=None,
-                 plot_type=None, slider_column=None):
-        """
-        Plotting class to create interactive graphs of profiles using Pandas, Plotly, and Dash.
-        :param input_csv: input csv that will be put into pandas data frame
-        :param plot_type: line or scatter
-        :param x: X variable
-        :param y: Y variable
-        :param color: field for selecting color, discrete color schemes only for line,
-         scatter supports discrete and continuous
-        :param grouping: how to group displayed vectors for coloring
-        :param hover: field displayed on mouseover
-        :param title: Main page title
-        :param subtitle: Specific plot title
-
-        """
-        self.input_csv = input_csv
-
-        self.x = x
-        self.y = y
-        self.color = color
-        self.grouping = grouping
-        self.hover = hover
-        self.title = title
-        self.subtitle = subtitle
-
-
-
-    def create_plot(self):
-        """
-        the function to actually draw the plot and run a local server displaying the
-        interactive data visualizations.
-        The Plotly/Dash documentation on lines and plots was used as a reference for this section.
-        (url: https://dash.plotly.com/basic-callbacks")
-        :return: console log of ip address for local server to access data visualizations
-        """
-        df = pd.read_csv(self.input_csv)
-        # df["ros"] = pd.to_numeric(df["ros"])
-        ext_style = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
-        app = dash.Dash(__name__, external_stylesheets=ext_style)
-        # unique = df.line_id.unique()
-        # min_list = df[self.slider_column].min()
-        # min = min_list[0]
-        # print(avg)
-        color_palate = {
-            "big-text": "#ffffff",
-            "regular-text": "#ffffff",
-            "background": "#f5f5f5", # graph background
-            "paper": "#121212" #main page background
-        }
-
-        plt = px.line(df, x=self.x, y=self.y, color=self.color, line_group=self.grouping, hover_name=self.hover)
-
-        plt.update_layout(
-            plot_bgcolor=color_palate["background"],
-            paper_bgcolor=color_palate["paper"],
-            font_color=color_palate["regular-text"]
-        )
-
-        # if self.plot_type == "tir":  # adds additional plot for average profile temperature
-        avg = df.groupby("distance", as_index=False).agg("mean")
-        avg_plt = px.line(avg, x=avg.distance, y=avg.pixel_val)
-        avg_plt.update_layout(
-            plot_bgcolor=color_palate["background"],
-            paper_bgcolor=color_palate["paper"],
-            font_color=color_palate["regular-text"]
-        )
-        app.layout = html.Div(style={"backgroundColor": color_palate["paper"]},
-                              children=[
-                                  html.H1(self.title, style={
-                                      "color": color_palate["regular-text"]
-                                  }),
-                                  html.Div(children=self.subtitle, style={
-                                      "color": color_palate["regular-text"]
-                                  }),
-                                  dcc.Graph(
-                                      id="plot",
-                                      figure=plt
-                                  ),
-                                  html.Div(children=("Average " + self.subtitle), style={
-                                      "color": color_palate["regular-text"]
-                                  }),
-                                  dcc.Graph(
-                                      figure=avg_plt
-                                  )
-                              ])
-        app.run_server(debug=True)
-        app.run_server(dev_tools_hot_reload=False)
-
-        # The below code was for a second graph that uses sliders, however there were some internal Dash JavaScript
-        # errors with the RangeSlider that could not be resolved.
-
-        # else:
-        #     # df = df.set_index("front_end")
-        #     app.layout = html.Div(style={"backgroundColor": color_palate["paper"]},
-        #                           children=[
-        #                               html.H1(self.title, style={
-        #                                   "color": color_palate["regular-text"]
-        #                               }),
-        #                               html.Div(children=self.subtitle, style={
-        #                                   "color": color_palate["regular-text"]
-        #                               }),
-        #                               html.Div([
-        #                                   dcc.Graph(
-        #                                       id="reg-plot"
-        #                                       # figure=plt
-        #                                   )
-        #                               ]),
-        #                               html.Div([
-        #                                   dcc.RangeSlider(
-        #                                       id="rangeslider",
-        #                                       min=df["ros"].min(),
-        #                                       max=df["ros"].max(),
-        #                                       # value=[df["ros"].min(), df["ros"].max()],
-        #                                       value=[df["ros"].min(), df["ros"].max()],
-        #                                       step=None,
-        #                                       allowCross=True
-        #                                   )
-        #                               ])
-        #
-        #                           ])
-        #
-        #     @app.callback(
-        #         Output("reg-plot", "figure"),
-        #         [Input("rangeslider", "value")])
-        #     def update_plot(val):
-        #         # val = "front_start"
-        #         print("original")
-        #         print(df)
-        #         print(val)
-        #         print(val[0])
-        #         # df_filter = df[(df["ros"] > val[0]) & (df["ros"] < val[1])]
-        #         df_filter = df[(df["ros"] < 30)]
-        #         print("filtered")
-        #         print(df_filter)
-        #         print(val[0])
-        #         plt2 = px.line(df_filter, x=self.x, y=self.y, color=self.color,
-        #         line_group=self.grouping, hover_name=self.hover)
-        #         #
-        #         # plt2.update_layout(
-        #         #     plot_bgcolor=color_palate["background"],
-        #         #     paper_bgcolor=color_palate["paper"],
-        #         #     font_color=color_palate["regular-text"]
-        #         # )
-        #         return plt2
-        #
+    def __init__(self, shp_path, raster_paths, raster_driver_name, shp_id_field,
+                 shp_front_start_field=None, shp_front_end_field=None, desired_fronts=None,
+                 raster_labels=None, csv_out_path=None, tir=False, block_cache_mb=None, reproject="points",
+                 out_format=None, resampling="nearest", use_nodata=True, exclude_values=None, scale=None, offset=None,
+                 stats_path=None, stats_bins=256, instrument=None, swath_width=None,
+                 swath_stats=("mean", "median", "max")):
+        """
+        :param shp_path: path to input shapefile, make sure shapefile is projected in desired CRS
+        :param raster_paths: list of paths to input raster images, sampled in the order given
+        :param raster_driver_name: GDAL driver for raster type
+        :param shp_id_field: id field to differentiate each vector in the shapefile
+        :param shp_front_start_field: starting fire front
+        :param shp_front_end_field: ending fire front
+        :param desired_fronts: optional list with one front per raster, only vectors starting at that front are
+         sampled from the matching raster
+        :param raster_labels: optional list with one label per raster (e.g. acquisition time) written to the raster
+         column, defaults to the raster file names
+        :param csv_out_path: out path for csv (or out_format file) containing extracted values
+        :param tir: set True for vector and thermal infrared imagery work, additional data cleaning and error handling
+         measures will be applied.
+        :param block_cache_mb: if set, rasters are read in native blocks through LRU caches holding this many
+         megabytes together, a raster listed more than once is served from the blocks already read
+        :param reproject: how to handle rasters in a different CRS than the shapefile ("points", "vrt" or "warp",
+         see ProfileExtractor)
+        :param out_format: output format ("csv", "parquet", "arrow" or "npz"), defaults to the csv_out_path extension
+        :param resampling: "nearest", "bilinear" or "cubic" interpolation of the pixel values
+        :param use_nodata: drop points on the NoData value of each raster band
+        :param exclude_values: raw pixel values to drop, defaults to 0 under TIR processing
+        :param scale: scale factor applied to pixel values (see ProfileExtractor)
+        :param offset: offset added to pixel values after scaling
+        :param stats_path: if set, statistics per raster and distance are accumulated from each raster's points as
+         they are written and saved to this sidecar file
+        :param stats_bins: number of histogram bins used to approximate the percentiles
+        :param instrument: per-phase timers and counters, summed over all rasters (see ProfileExtractor)
+        :param swath_width: if set, swath statistics across this width are written for every point (see
+         ProfileExtractor)
+        :param swath_stats: swath statistics to write
+        """
+        super().__init__(shp_path, raster_paths[0], raster_driver_name, shp_id_field,
+                         shp_front_start_field=shp_front_start_field, shp_front_end_field=shp_front_end_field,
+                         csv_out_path=csv_out_path, tir=tir, block_cache_mb=block_cache_mb, reproject=reproject,
+                         out_format=out_format, resampling=resampling, use_nodata=use_nodata,
+                         exclude_values=exclude_values, scale=scale, offset=offset, stats_path=stats_path,
+                         stats_bins=stats_bins, instrument=instrument, swath_width=swath_width,
+                         swath_stats=swath_stats)
+        self.raster_paths = list(raster_paths)
+        self.desired_fronts = desired_fronts
+        if raster_labels is None:
+            raster_labels = [os.path.splitext(os.path.basename(path))[0] for path in self.raster_paths]
+        self.raster_labels = raster_labels
+        for name, values in (("desired_fronts", desired_fronts), ("raster_labels", raster_labels)):
+            if values is not None and len(values) != len(self.raster_paths):
+                raise ValueError("{} has {} entries for {} rasters".format(name, len(values), len(self.raster_paths)))
+
+    def _attribute_filter(self):
+        """
+        :return: OGR attribute filter reading only the features of the desired_fronts, None to read all of them
+        """
+        if self.desired_fronts is None:
+            return None
+        fronts = sorted(set(int(front) for front in self.desired_fronts))
+        return '"{}" IN ({})'.format(self.shp_front_start_field, ", ".join(str(front) for front in fronts))
+
+    def extractor(self, workers=None, chunk_size=256):
+        """
+        A function to extract pixel values from every input raster along the shapefile features. Points are
+        interpolated at the spatial resolution of the first raster.
+        :param workers: number of worker processes to sample each raster with, None or 1 for serial processing
+        :param chunk_size: number of lines per parallel work unit
+        :return: outputs a CSV (or out_format file) of point values for every raster in desired output directory,
+         returns the instrumentation report if instrument is set
+        """
+        instrument = self.instrument
+        instrument.start()
+        # setting up shapefile
+        with instrument.phase("open_shapefile"):
+            shp_driver = ogr.GetDriverByName('ESRI Shapefile')
+            shp = shp_driver.Open(self.shp_path, 0)
+            shp_lyr = shp.GetLayer()
+            shp_epsg = shp_lyr.GetSpatialRef()
+        with instrument.phase("open_raster"):
+            rasters = [self._open_raster(raster_path, shp_epsg) for raster_path in self.raster_paths]
+            interp_dist = self._interp_dist(rasters[0][0], shp_epsg if rasters[0][2] else None)
+
+        # features are filtered and clipped to the combined extent of all rasters
+        with instrument.phase("read_features"):
+            rects = np.array([self._raster_rect(raster, shp_epsg, transform, interp_dist)
+                              for raster, _, transform in rasters])
+            rect = (rects[:, 0].min(), rects[:, 1].min(), rects[:, 2].max(), rects[:, 3].max())
+            shp_pts = self._read_features(shp_lyr, rect)
+        line_fronts = np.array([int(line[1]) if self.desired_fronts is not None else 0 for line in shp_pts],
+                               dtype=np.int64)
+        with instrument.phase("densify"):
+            lines = [line[-1] for line in shp_pts]
+            line_idx, dists, xs, ys = densify_lines(lines, interp_dist, clip=clip_to_rect(lines, rect))
+        instrument.count("points_interpolated", xs.size)
+        print("{} points interpolated along {} lines".format(xs.size, len(shp_pts)))
+
+        stats = None
+        if self.stats_path:
+            with instrument.phase("stats"):
+                ranges = np.array([self._value_range(raster) for raster, _, _ in rasters])
+            stats = ProfileStats(interp_dist, (ranges[:, 0].min(), ranges[:, 1].max()), group_name="raster",
+                                 n_hist_bins=self.stats_bins)
 
+        attributes = self._attribute_arrays(shp_pts)
+        labels = np.array(self.raster_labels, dtype=object)
+        if self._typed_output():
+            labels = typed_column(self.raster_labels)
+        writer = open_writer(self.csv_out_path, ["raster"] + self._fields() + self._point_columns(), self.out_format)
+        try:
+            for k, (raster, sample_path, transform) in enumerate(rasters):
+                if self.desired_fronts is not None:
+                    selected = np.flatnonzero(line_fronts[line_idx] == int(self.desired_fronts[k]))
+                else:
+                    selected = np.arange(xs.size)
+                print("sampling {} ({} points)".format(self.raster_paths[k], selected.size))
+                z_pts, status, swath = self._sample_profile(raster, sample_path, transform, lines, line_idx[selected],
+                                                            dists[selected], xs[selected], ys[selected], interp_dist,
+                                                            workers, chunk_size)
+                keep, z_pts = self._clean_values(z_pts, status)
+                kept = selected[keep]
+                points = {"distance": dists[kept], "x": xs[kept], "y": ys[kept], "pixel_val": z_pts}
+                points.update({name: values[keep] for name, values in swath.items()})
+                with instrument.phase("write"):
+                    batch = {"raster": np.repeat(labels[k:k + 1], kept.size)}
+                    batch.update(self._batch(attributes, line_idx[kept], points))
+                    writer.write_batch(batch)
+                instrument.count("rows_written", kept.size)
+                if stats is not None:
+                    with instrument.phase("stats"):
+                        stats.update(batch["raster"], batch["distance"], batch["pixel_val"])
+        finally:
+            writer.close()
+        if stats is not None:
+            with instrument.phase("stats"):
+                self._write_stats(stats)
+        return instrument.finish()
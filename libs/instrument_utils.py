@@ -0,0 +1,178 @@
+# script for timing and counting the phases of an extraction
+import json
+import time
+from . import raster_utils
+
+
+class _NullPhase:
+    """
+    Context manager that does nothing, shared by every phase of a disabled Instrumentation.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    """
+    Context manager timing one phase and counting the GDAL reads made during it (see raster_utils.read_counter).
+    """
+
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+
+    def __enter__(self):
+        self.reads = dict(raster_utils.read_counter)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        phase = self.instrument.phases.setdefault(self.name, {"seconds": 0.0, "calls": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+        for key, count in (("gdal_reads", "reads"), ("bytes_read", "bytes")):
+            n = raster_utils.read_counter[count] - self.reads[count]
+            if n:
+                self.instrument.count(key, n)
+        self.instrument._emit("phase", self.name, seconds)
+        return False
+
+
+class Instrumentation:
+    """
+    Timers and counters for the phases of an extraction (opening the raster, reading features, interpolating,
+    sampling, writing...). Phases are timed with `with instrument.phase("name"):` and counters added with
+    instrument.count("name", n). Hooks are called as hook(event, name, value) for every finished phase
+    ("phase", name, seconds) and counter update ("count", name, n), and the whole run can optionally be profiled
+    with cProfile.
+    """
+
+    enabled = True
+
+    def __init__(self, hooks=None, report_path=None, profile_path=None):
+        """
+        :param hooks: optional list of callables hook(event, name, value)
+        :param report_path: if set, finish() writes the report to this JSON file
+        :param profile_path: if set, the run is profiled with cProfile and the stats saved to this file (read it with
+         pstats.Stats(profile_path) or snakeviz)
+        """
+        self.hooks = list(hooks or [])
+        self.report_path = report_path
+        self.profile_path = profile_path
+        self.phases = {}
+        self.counters = {}
+        self.profiler = None
+        self.started = None
+
+    def add_hook(self, hook):
+        """
+        :param hook: callable hook(event, name, value)
+        """
+        self.hooks.append(hook)
+
+    def _emit(self, event, name, value):
+        for hook in self.hooks:
+            hook(event, name, value)
+
+    def phase(self, name):
+        """
+        :param name: phase name, time spent in phases with the same name is added up
+        :return: context manager timing the phase
+        """
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """
+        :param name: counter name
+        :param n: amount to add
+        """
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+        self._emit("count", name, n)
+
+    def start(self):
+        """
+        Starts a run: clears the phases and counters of any earlier run (a reused extractor reports each run on its
+        own) and starts the run clock and the profiler (if profile_path is set).
+        """
+        self.phases = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        if self.profile_path:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def report(self):
+        """
+        :return: dictionary with the total run time, the time and number of calls of every phase and the counters
+        """
+        total = time.perf_counter() - self.started if self.started is not None else None
+        return {"total_seconds": total, "phases": {name: dict(phase) for name, phase in self.phases.items()},
+                "counters": dict(self.counters)}
+
+    def finish(self):
+        """
+        Stops the profiler and writes the report and profile files that were asked for.
+        :return: report dictionary (see report)
+        """
+        report = self.report()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            self.profiler = None
+            report["profile_path"] = self.profile_path
+        if self.report_path:
+            with open(self.report_path, "w") as report_json:
+                json.dump(report, report_json, indent=2)
+            print("instrumentation report written to {}".format(self.report_path))
+        return report
+
+
+class NullInstrumentation:
+    """
+    Stand-in for Instrumentation when it is disabled, every method does nothing so the extractor can call it freely.
+    """
+
+    enabled = False
+
+    def add_hook(self, hook):
+        pass
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def start(self):
+        pass
+
+    def report(self):
+        return None
+
+    def finish(self):
+        return None
+
+
+def instrumentation(option):
+    """
+    function to turn the instrument option of the extractors into an instrumentation object
+    :param option: None/False for none, True for timers and counters only, an Instrumentation, or a path for the
+     JSON report
+    :return: Instrumentation or NullInstrumentation
+    """
+    if not option:
+        return NullInstrumentation()
+    if option is True:
+        return Instrumentation()
+    if isinstance(option, str):
+        return Instrumentation(report_path=option)
+    return option
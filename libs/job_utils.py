@@ -0,0 +1,96 @@
+# script for running extraction jobs described in config files
+import json
+import os
+import time
+
+# names used in the "fields" section of a job and the extractor arguments they set
+FIELD_ARGS = {"id": "shp_id_field", "front_start": "shp_front_start_field", "front_end": "shp_front_end_field"}
+
+
+def load_jobs(path):
+    """
+    function to read the jobs of a JSON config file. The file holds one job, a list of jobs, or
+    {"defaults": {...}, "jobs": [...]} where every job is merged over the defaults, so many small jobs can share
+    one file (and one process). A job looks like:
+        {"shapefile": "data/shp/vectors.shp", "raster": "data/raster/tir.img", "raster_driver": "HFA",
+         "fields": {"id": "vect_id", "front_start": "front", "front_end": null}, "front": 2, "tir": true,
+         "output": "output/profiles.csv", "workers": null, "options": {"resampling": "bilinear"},
+         "plot": {"x": "distance", "y": "pixel_val", ...}}
+    "rasters" (and optionally "fronts" and "raster_labels") instead of "raster"/"front" runs a TimeSeriesExtractor.
+    "options" holds any other extractor argument and "plot" the Plotter arguments used with --plot JOB.
+    :param path: path to the config file
+    :return: list of job dictionaries
+    """
+    with open(path) as config:
+        jobs = json.load(config)
+    defaults = {}
+    if isinstance(jobs, dict) and "jobs" in jobs:
+        defaults, jobs = jobs.get("defaults", {}), jobs["jobs"]
+    if isinstance(jobs, dict):
+        jobs = [jobs]
+    merged = []
+    for job in jobs:
+        full = dict(defaults, **job)
+        for key in ("fields", "options"):
+            full[key] = dict(defaults.get(key) or {}, **(job.get(key) or {}))
+        for key in ("shapefile", "output"):
+            if key not in full:
+                raise ValueError("Job {} in {} has no {}".format(len(merged) + 1, path, key))
+        if "raster" not in full and "rasters" not in full:
+            raise ValueError("Job {} in {} has no raster or rasters".format(len(merged) + 1, path))
+        if "id" not in full["fields"]:
+            raise ValueError("Job {} in {} has no id field".format(len(merged) + 1, path))
+        unknown = set(full["fields"]) - set(FIELD_ARGS)
+        if unknown:
+            raise ValueError("Job {} in {} has unknown fields: {}".format(len(merged) + 1, path,
+                                                                        ", ".join(sorted(unknown))))
+        merged.append(full)
+    return merged
+
+
+def build_extractor(job):
+    """
+    function to create the extractor for a job
+    :param job: job dictionary (see load_jobs)
+    :return: ProfileExtractor, or TimeSeriesExtractor for a job with "rasters"
+    """
+    from .general_utils import ProfileExtractor, TimeSeriesExtractor
+
+    kwargs = {FIELD_ARGS[name]: field for name, field in job["fields"].items()}
+    kwargs.update(csv_out_path=job["output"], tir=job.get("tir", False), **job["options"])
+    driver = job.get("raster_driver", "GTiff")
+    if "rasters" in job:
+        return TimeSeriesExtractor(job["shapefile"], job["rasters"], driver, desired_fronts=job.get("fronts"),
+                                   raster_labels=job.get("raster_labels"), **kwargs)
+    return ProfileExtractor(job["shapefile"], job["raster"], driver, desired_front=job.get("front"), **kwargs)
+
+
+def run_job(job, workers=None):
+    """
+    function to run the extraction of a job, creating the output directory if needed
+    :param job: job dictionary (see load_jobs)
+    :param workers: number of worker processes, overrides the job's "workers"
+    :return: seconds taken and the instrumentation report (None unless the job's options set instrument)
+    """
+    start = time.perf_counter()
+    out_dir = os.path.dirname(job["output"])
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    extractor = build_extractor(job)
+    report = extractor.extractor(workers=workers or job.get("workers"), chunk_size=job.get("chunk_size", 256))
+    return time.perf_counter() - start, report
+
+
+def plot_job(job):
+    """
+    function to serve the dashboard of a job's output, the only place the plotting stack (pandas, plotly and dash)
+    is imported
+    :param job: job dictionary with a "plot" section of Plotter arguments
+    """
+    from .plot_utils import Plotter
+
+    plot = dict(job["plot"])
+    plot.setdefault("input_csv", job["output"])
+    if job["options"].get("stats_path"):
+        plot.setdefault("stats_path", job["options"]["stats_path"])
+    Plotter(**plot).create_plot()
@@ -0,0 +1,219 @@
+# script for writing and reading extracted profiles
+import csv
+import os
+import numpy as np
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".npz": "npz"}
+
+
+def output_format(path, fmt=None):
+    """
+    function to work out the output format from a file extension
+    :param path: output path
+    :param fmt: explicit format ("csv", "parquet", "arrow" or "npz"), overrides the extension
+    :return: format name
+    """
+    if fmt is not None:
+        return fmt
+    return FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+
+
+def typed_column(values):
+    """
+    function to turn a list of attribute strings (from GetFieldAsString) into a typed array, integer or float if
+    every value parses as one, otherwise string
+    :param values: list or array of strings
+    :return: NumPy array
+    """
+    values = np.asarray(values, dtype=str)
+    for dtype in (np.int64, np.float64):
+        try:
+            return values.astype(dtype)
+        except ValueError:
+            continue
+    return values
+
+
+def _column(values):
+    """
+    helper to get the array written for a column, object arrays of strings are typed from their own values (see
+    typed_column). The extractors pass attribute columns already typed once per feature.
+    :param values: array of column values
+    :return: NumPy array
+    """
+    values = np.asarray(values)
+    return typed_column(values) if values.dtype == object else values
+
+
+class CsvWriter:
+    """
+    Writes batches of columns as rows of a CSV file, the text output the extractor has always produced.
+    """
+
+    def __init__(self, path, columns):
+        """
+        :param path: output path
+        :param columns: column names, in output order
+        """
+        self.columns = list(columns)
+        self.out_csv = open(path, "w", newline="", encoding="utf-8-sig")
+        self.to_csv = csv.writer(self.out_csv, quoting=csv.QUOTE_NONE)
+        self.to_csv.writerow(self.columns)
+
+    def write_batch(self, batch):
+        """
+        :param batch: dictionary of column name to equal length arrays
+        """
+        self.to_csv.writerows(zip(*[batch[c] for c in self.columns]))
+
+    def close(self):
+        self.out_csv.close()
+
+
+class NpzWriter:
+    """
+    Collects batches of columns and saves them as one NumPy .npz archive (one array per column) on close.
+    Only needs NumPy, but holds the whole output in memory until closed.
+    """
+
+    def __init__(self, path, columns):
+        """
+        :param path: output path
+        :param columns: column names, in output order
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.batches = {c: [] for c in self.columns}
+
+    def write_batch(self, batch):
+        """
+        :param batch: dictionary of column name to equal length arrays
+        """
+        for c in self.columns:
+            self.batches[c].append(_column(batch[c]))
+
+    def close(self):
+        arrays = {c: np.concatenate(parts) if parts else np.zeros(0) for c, parts in self.batches.items()}
+        with open(self.path, "wb") as out_npz:
+            np.savez(out_npz, **arrays)
+
+
+class ArrowWriter:
+    """
+    Writes batches of columns to Parquet or Arrow IPC (Feather v2) files with pyarrow, one record batch/row group
+    per call to write_batch. The schema is taken from the first batch with rows, so attribute columns should be
+    passed already typed for every feature (as the extractors do), a later batch of strings that do not parse as the
+    first one's types can not be cast to the schema.
+    """
+
+    def __init__(self, path, columns, fmt="parquet"):
+        """
+        :param path: output path
+        :param columns: column names, in output order
+        :param fmt: "parquet" or "arrow"
+        """
+        import pyarrow  # optional dependency, only needed for these formats
+        self.pa = pyarrow
+        self.path = path
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.writer = None
+        self.schema = None
+        self.empty = None
+
+    def write_batch(self, batch):
+        """
+        :param batch: dictionary of column name to equal length arrays, empty batches are only written (as the
+         schema of an empty file) if no batch with rows follows
+        """
+        arrays = [_column(batch[c]) for c in self.columns]
+        table = self.pa.Table.from_arrays([self.pa.array(a) for a in arrays], names=self.columns)
+        if table.num_rows == 0:
+            if self.writer is None and self.empty is None:
+                self.empty = table
+            return
+        self._write(table)
+
+    def _write(self, table):
+        """
+        Writes a table, opening the file with the table's schema on the first call.
+        :param table: pyarrow Table
+        """
+        if self.writer is None:
+            self.schema = table.schema
+            if self.fmt == "parquet":
+                import pyarrow.parquet
+                self.writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            else:
+                import pyarrow.ipc
+                self.writer = pyarrow.ipc.new_file(self.path, table.schema)
+        elif table.schema != self.schema:
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is None and self.empty is not None:
+            self._write(self.empty)
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path, columns, fmt=None):
+    """
+    function to open the output backend for a path
+    :param path: output path
+    :param columns: column names, in output order
+    :param fmt: explicit format ("csv", "parquet", "arrow" or "npz"), defaults to the file extension (CSV if unknown)
+    :return: writer with write_batch(batch) and close() methods
+    """
+    fmt = output_format(path, fmt)
+    if fmt == "csv":
+        return CsvWriter(path, columns)
+    if fmt == "npz":
+        return NpzWriter(path, columns)
+    if fmt in ("parquet", "arrow"):
+        return ArrowWriter(path, columns, fmt=fmt)
+    raise ValueError("Unknown output format: {}".format(fmt))
+
+
+def table_columns(path, fmt=None):
+    """
+    function to list the columns of a file written by the extractor without loading its rows
+    :param path: path to a file written by the extractor
+    :param fmt: explicit format, defaults to the file extension
+    :return: list of column names
+    """
+    fmt = output_format(path, fmt)
+    if fmt == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_schema(path).names
+    if fmt == "arrow":
+        import pyarrow.ipc
+        with pyarrow.memory_map(path) as source:
+            return pyarrow.ipc.open_file(source).schema.names
+    if fmt == "npz":
+        with np.load(path, allow_pickle=False) as npz:
+            return list(npz.files)
+    with open(path, newline="", encoding="utf-8-sig") as in_csv:
+        return next(csv.reader(in_csv), [])
+
+
+def read_table(path, columns=None, fmt=None):
+    """
+    function to load extracted profiles into a pandas data frame, reading only the requested columns
+    :param path: path to a file written by the extractor
+    :param columns: list of columns to load, None for all
+    :param fmt: explicit format, defaults to the file extension
+    :return: pandas DataFrame
+    """
+    import pandas as pd
+    fmt = output_format(path, fmt)
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    if fmt == "arrow":
+        import pyarrow.feather
+        return pyarrow.feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if fmt == "npz":
+        with np.load(path, allow_pickle=False) as npz:
+            return pd.DataFrame({c: npz[c] for c in (columns if columns is not None else npz.files)})
+    return pd.read_csv(path, usecols=columns, encoding="utf-8-sig")
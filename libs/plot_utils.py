@@ -0,0 +1,459 @@
+# script for plotting specific functions
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import dash
+import dash_core_components as dcc
+import dash_html_components as html
+from dash.dependencies import Input, Output
+from functools import lru_cache
+from .output_utils import read_table, table_columns
+
+# per-profile attribute columns indexed at load time when the extracted file has them
+INDEX_COLUMNS = ("ros", "front_start", "front_end", "line_id")
+
+
+def lttb(x, y, n_out):
+    """
+    function to downsample one series with the Largest-Triangle-Three-Buckets algorithm (Steinarsson, 2013), which
+    keeps the points that contribute most to the visual shape of the line.
+    :param x: array of x values, sorted
+    :param y: array of y values
+    :param n_out: number of points to keep
+    :return: indices of the kept points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    edges = np.append(edges, n)
+    kept = np.zeros(n_out, dtype=np.int64)
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        avg_x = x[hi:edges[i + 2]].mean()
+        avg_y = y[hi:edges[i + 2]].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    kept[-1] = n - 1
+    return kept
+
+
+def minmax_downsample(x, y, groups, n_bins, x_range=None):
+    """
+    function to downsample many series at once by keeping the first, last, lowest and highest point of every series
+    in each of n_bins equal x intervals. With n_bins set to the plot width in pixels nothing visible is lost.
+    :param x: array of x values, sorted within each series
+    :param y: array of y values
+    :param groups: array of integer series codes (e.g. from pandas.factorize)
+    :param n_bins: number of x intervals
+    :param x_range: (min, max) of x spanned by the bins, defaults to the range of x
+    :return: sorted indices of the kept points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    if x.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    x_min, x_max = (np.nanmin(x), np.nanmax(x)) if x_range is None else x_range
+    span = (x_max - x_min) or 1.0
+    bins = np.clip(((x - x_min) / span * n_bins).astype(np.int64), 0, n_bins - 1)
+    keys = groups * n_bins + bins
+    order = np.lexsort((y, keys))
+    starts = np.flatnonzero(np.diff(keys[order], prepend=-1))
+    ends = np.append(starts[1:], order.size) - 1
+    # first/last point of each bin keeps the line continuous, min/max keep the peaks
+    by_key = np.argsort(keys, kind="stable")
+    key_starts = np.flatnonzero(np.diff(keys[by_key], prepend=-1))
+    key_ends = np.append(key_starts[1:], by_key.size) - 1
+    kept = np.concatenate([order[starts], order[ends], by_key[key_starts], by_key[key_ends]])
+    return np.unique(kept)
+
+
+def downsample_profiles(df, x, y, grouping, n_out, method="minmax", x_range=None):
+    """
+    function to reduce every profile in a data frame to about n_out points
+    :param df: pandas DataFrame of profiles, sorted by x within each profile
+    :param x: x column
+    :param y: y column
+    :param grouping: column identifying each profile
+    :param n_out: target number of points per profile, usually the plot width in pixels
+    :param method: "minmax" (vectorized across all profiles) or "lttb" (per profile)
+    :param x_range: (min, max) of x being displayed, defaults to the range of the data
+    :return: downsampled DataFrame
+    """
+    codes = df[grouping].factorize()[0]
+    if method == "lttb":
+        order = np.argsort(codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        kept = [part[lttb(df[x].values[part], df[y].values[part], n_out)] for part in np.split(order, bounds)]
+        kept = np.sort(np.concatenate(kept)) if kept else np.zeros(0, dtype=np.int64)
+    else:
+        kept = minmax_downsample(df[x].values, df[y].values, codes, max(n_out // 2, 1), x_range)
+    return df.iloc[kept]
+
+
+def webgl_figure(df, x, y, color, grouping, hover, max_traces=50):
+    """
+    function to draw line profiles with WebGL (Scattergl). Instead of one trace per profile, all profiles sharing a
+    color are joined into a single trace broken by gaps, so the browser handles a handful of traces. When there are
+    more color values than max_traces (e.g. coloring by line id) profiles that get the same palette color share a trace.
+    :param df: pandas DataFrame of profiles, sorted by x within each profile
+    :param x: x column
+    :param y: y column
+    :param color: column used to color the profiles
+    :param grouping: column identifying each profile
+    :param hover: column displayed on mouseover
+    :param max_traces: largest number of traces drawn
+    :return: plotly Figure
+    """
+    palette = px.colors.qualitative.Plotly
+    color_codes, color_values = df[color].factorize()
+    shared = len(color_values) > max_traces
+    trace_codes = color_codes % len(palette) if shared else color_codes
+    fig = go.Figure()
+    for k in np.unique(trace_codes):
+        sub = df[trace_codes == k]
+        codes = sub[grouping].factorize()[0]
+        gaps = np.flatnonzero(np.diff(codes)) + 1
+        name = "{} group {}".format(color, k + 1) if shared else str(color_values[k])
+        fig.add_trace(go.Scattergl(
+            x=np.insert(sub[x].values.astype(np.float64), gaps, np.nan),
+            y=np.insert(sub[y].values.astype(np.float64), gaps, np.nan),
+            hovertext=np.insert(sub[hover].astype(str).values.astype(object), gaps, ""),
+            mode="lines", name=name, line={"color": palette[k % len(palette)], "width": 1}, connectgaps=False
+        ))
+    fig.update_layout(xaxis_title=x, yaxis_title=y, legend_title_text=color)
+    return fig
+
+
+def stats_figure(stats, x="distance"):
+    """
+    function to draw an average profile from a statistics table (see stats_utils.ProfileStats), with the 5-95 and
+    25-75 percentile ranges as shaded bands around the mean
+    :param stats: pandas DataFrame of one group of the statistics table
+    :param x: distance column
+    :return: plotly Figure
+    """
+    stats = stats.sort_values(x)
+    fig = go.Figure()
+    for low, high, opacity in (("p05", "p95", 0.2), ("p25", "p75", 0.35)):
+        if low not in stats or high not in stats:
+            continue
+        fig.add_trace(go.Scatter(x=stats[x], y=stats[high], mode="lines", line={"width": 0}, showlegend=False,
+                                 hoverinfo="skip"))
+        fig.add_trace(go.Scatter(x=stats[x], y=stats[low], mode="lines", line={"width": 0}, fill="tonexty",
+                                 fillcolor="rgba(99, 110, 250, {})".format(opacity), name="{}-{}".format(low, high)))
+    fig.add_trace(go.Scatter(x=stats[x], y=stats["mean"], mode="lines", name="mean", line={"color": "#636efa"}))
+    fig.update_layout(xaxis_title=x, yaxis_title="pixel_val")
+    return fig
+
+
+def zoom_range(relayout_data):
+    """
+    function to read the zoomed x range from a dcc.Graph relayoutData event
+    :param relayout_data: relayoutData dictionary
+    :return: (min, max) of the zoomed x axis, or None when the axis is reset or unchanged
+    """
+    if not relayout_data or relayout_data.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout_data:
+        return relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    if "xaxis.range" in relayout_data:
+        return tuple(relayout_data["xaxis.range"])
+    return None
+
+
+class ProfileIndex:
+    """
+    Sorted indexes over the per-profile attributes of an extracted data frame (e.g. ros, front_start, front_end and
+    line_id). Rows are regrouped so each profile is one contiguous slice, and range or value selections are resolved
+    by binary search over the sorted attribute values instead of scanning every row.
+    """
+
+    def __init__(self, df, grouping, columns):
+        """
+        :param df: pandas DataFrame of profiles
+        :param grouping: column identifying each profile
+        :param columns: attribute columns to index, each is expected to be constant within a profile
+        """
+        codes, self.profiles = df[grouping].factorize()
+        order = np.argsort(codes, kind="stable")
+        self.df = df.iloc[order].reset_index(drop=True)
+        codes = codes[order]
+        self.starts = np.flatnonzero(np.diff(codes, prepend=-1))
+        self.ends = np.append(self.starts[1:], codes.size)
+        self.indexes = {}
+        for column in [grouping] + [c for c in columns if c != grouping]:
+            values = self.df[column].values[self.starts]
+            by_value = np.argsort(values, kind="stable")
+            self.indexes[column] = (values[by_value], by_value)
+
+    def select_range(self, column, low, high):
+        """
+        Profiles whose value of column lies in [low, high].
+        :param column: indexed column
+        :param low: lower bound
+        :param high: upper bound
+        :return: sorted array of profile numbers
+        """
+        values, by_value = self.indexes[column]
+        return np.sort(by_value[np.searchsorted(values, low, "left"):np.searchsorted(values, high, "right")])
+
+    def select_values(self, column, wanted):
+        """
+        Profiles whose value of column is one of wanted.
+        :param column: indexed column
+        :param wanted: iterable of values
+        :return: sorted array of profile numbers
+        """
+        parts = [self.select_range(column, value, value) for value in wanted]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def frame(self, profiles=None):
+        """
+        Rows of the selected profiles.
+        :param profiles: array of profile numbers, None for all
+        :return: pandas DataFrame
+        """
+        if profiles is None:
+            return self.df
+        lengths = self.ends[profiles] - self.starts[profiles]
+        rows = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.df.iloc[rows + np.repeat(self.starts[profiles], lengths)]
+
+
+class Plotter:
+    """
+    This class is used to generate the interactive dashboard and data visualizations.
+    """
+
+    def __init__(self, input_csv, x, y, color, grouping, hover, title, subtitle=None,
+                 plot_type=None, slider_column=None, render_mode="auto", webgl_threshold=100000, plot_width=1200,
+                 downsample="minmax", filter_columns=None, cache_size=32, stats_path=None):
+        """
+        Plotting class to create interactive graphs of profiles using Pandas, Plotly, and Dash.
+        :param input_csv: input csv that will be put into pandas data frame, Parquet/Arrow/NPZ output from the
+         extractor is read directly based on the file extension
+        :param plot_type: line or scatter
+        :param x: X variable
+        :param y: Y variable
+        :param color: field for selecting color, discrete color schemes only for line,
+         scatter supports discrete and continuous
+        :param grouping: how to group displayed vectors for coloring
+        :param hover: field displayed on mouseover
+        :param title: Main page title
+        :param subtitle: Specific plot title
+        :param render_mode: "svg" draws one plotly express trace per profile, "webgl" draws Scattergl traces of
+         downsampled profiles and refines them when zooming, "auto" switches to webgl above webgl_threshold points
+        :param webgl_threshold: number of points above which "auto" uses webgl
+        :param plot_width: width of the plot in pixels, profiles are downsampled to about this many points
+        :param downsample: "minmax" or "lttb" downsampling under webgl, None to send every point
+        :param slider_column: if set (e.g. "ros"), adds a filtered plot with a range slider over this column
+        :param filter_columns: optional column or list of columns (e.g. ["front_start", "front_end"]), each gets a
+         dropdown filter next to the slider (the filtered plot is added for these alone too)
+        :param cache_size: number of filter selections (the selected profile numbers and their average profile) kept
+         in memory, so moving back to a slider position is instant. Figures are rebuilt from them, not cached.
+        :param stats_path: statistics sidecar written by the extractor (stats_path option), if set the average plot
+         is drawn from it with percentile bands instead of being computed from every sample
+        """
+        self.input_csv = input_csv
+
+        self.x = x
+        self.y = y
+        self.color = color
+        self.grouping = grouping
+        self.hover = hover
+        self.title = title
+        self.subtitle = subtitle
+        self.render_mode = render_mode
+        self.webgl_threshold = webgl_threshold
+        self.plot_width = plot_width
+        self.downsample = downsample
+        self.slider_column = slider_column
+        if isinstance(filter_columns, str):
+            filter_columns = [filter_columns]
+        self.filter_columns = list(filter_columns or [])
+        self.cache_size = cache_size
+        self.stats_path = stats_path
+
+    def _webgl_plot(self, df, x_range=None):
+        """
+        Draws the profiles with WebGL, downsampled to the plot width over the displayed x range.
+        :param df: profile data frame
+        :param x_range: (min, max) of the zoomed x axis, None for all of it
+        :return: plotly Figure
+        """
+        if x_range is not None:
+            df = df[(df[self.x] >= x_range[0]) & (df[self.x] <= x_range[1])]
+        if self.downsample:
+            df = downsample_profiles(df, self.x, self.y, self.grouping, self.plot_width, method=self.downsample,
+                                     x_range=x_range)
+        plt = webgl_figure(df, self.x, self.y, self.color, self.grouping, self.hover)
+        plt.update_layout(uirevision="plot")  # keeps the zoom when the figure is refined
+        return plt
+
+    def create_plot(self):
+        """
+        the function to actually draw the plot and run a local server displaying the
+        interactive data visualizations.
+        The Plotly/Dash documentation on lines and plots was used as a reference for this section.
+        (url: https://dash.plotly.com/basic-callbacks")
+        :return: console log of ip address for local server to access data visualizations
+        """
+        # only the plotted columns are loaded, with the per-profile attributes that are indexed
+        filters = [c for c in [self.slider_column] + self.filter_columns if c]
+        indexed = filters + [c for c in INDEX_COLUMNS if c in table_columns(self.input_csv)]
+        columns = list(dict.fromkeys([self.x, self.y, self.color, self.grouping, self.hover, "distance", "pixel_val"] +
+                                     indexed))
+        # built once, every filter selection is then a binary search over the sorted attributes
+        index = ProfileIndex(read_table(self.input_csv, columns=columns), self.grouping, indexed)
+        df = index.df
+        # df["ros"] = pd.to_numeric(df["ros"])
+        ext_style = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
+        app = dash.Dash(__name__, external_stylesheets=ext_style)
+        # unique = df.line_id.unique()
+        # min_list = df[self.slider_column].min()
+        # min = min_list[0]
+        # print(avg)
+        color_palate = {
+            "big-text": "#ffffff",
+            "regular-text": "#ffffff",
+            "background": "#f5f5f5", # graph background
+            "paper": "#121212" #main page background
+        }
+
+        webgl = self.render_mode == "webgl" or (self.render_mode == "auto" and len(df) > self.webgl_threshold)
+        if webgl:
+            plt = self._webgl_plot(df)
+        else:
+            plt = px.line(df, x=self.x, y=self.y, color=self.color, line_group=self.grouping, hover_name=self.hover)
+
+        plt.update_layout(
+            plot_bgcolor=color_palate["background"],
+            paper_bgcolor=color_palate["paper"],
+            font_color=color_palate["regular-text"]
+        )
+
+        # if self.plot_type == "tir":  # adds additional plot for average profile temperature
+        if self.stats_path:
+            stats = read_table(self.stats_path)
+            avg_plt = stats_figure(stats[stats[stats.columns[0]].astype(str) == "all"])
+        else:
+            avg = df.groupby("distance", as_index=False)["pixel_val"].mean()
+            avg_plt = px.line(avg, x=avg.distance, y=avg.pixel_val)
+        avg_plt.update_layout(
+            plot_bgcolor=color_palate["background"],
+            paper_bgcolor=color_palate["paper"],
+            font_color=color_palate["regular-text"]
+        )
+        app.layout = html.Div(style={"backgroundColor": color_palate["paper"]},
+                              children=[
+                                  html.H1(self.title, style={
+                                      "color": color_palate["regular-text"]
+                                  }),
+                                  html.Div(children=self.subtitle, style={
+                                      "color": color_palate["regular-text"]
+                                  }),
+                                  dcc.Graph(
+                                      id="plot",
+                                      figure=plt
+                                  ),
+                                  html.Div(children=("Average " + self.subtitle), style={
+                                      "color": color_palate["regular-text"]
+                                  }),
+                                  dcc.Graph(
+                                      figure=avg_plt
+                                  )
+                              ] + self._filter_layout(df, color_palate))
+
+        if webgl:
+            @app.callback(Output("plot", "figure"), [Input("plot", "relayoutData")], prevent_initial_call=True)
+            def refine_plot(relayout_data):
+                # re-downsamples the zoomed range so detail appears as the user zooms in
+                zoomed = self._webgl_plot(df, zoom_range(relayout_data))
+                zoomed.update_layout(
+                    plot_bgcolor=color_palate["background"],
+                    paper_bgcolor=color_palate["paper"],
+                    font_color=color_palate["regular-text"]
+                )
+                return zoomed
+
+        if filters:
+            @lru_cache(maxsize=self.cache_size)
+            def selection(slider_range, filter_values):
+                # only the profile numbers and the average profile are cached, figures can hold every selected point
+                profiles = np.arange(len(index.profiles))
+                if slider_range is not None:
+                    profiles = index.select_range(self.slider_column, *slider_range)
+                for column, wanted in zip(self.filter_columns, filter_values):
+                    if wanted:
+                        profiles = np.intersect1d(profiles, index.select_values(column, wanted))
+                selected = index.frame(profiles)
+                return profiles, selected.groupby(self.x, as_index=False)[self.y].mean()
+
+            inputs = [Input("rangeslider", "value")] if self.slider_column else []
+            inputs += [Input("filter-dropdown-{}".format(column), "value") for column in self.filter_columns]
+
+            @app.callback([Output("filter-plot", "figure"), Output("filter-avg-plot", "figure")], inputs)
+            def update_filtered(*values):
+                slider_range = tuple(values[0]) if self.slider_column else None
+                filter_values = tuple(tuple(sorted(v or ())) for v in values[1 if self.slider_column else 0:])
+                profiles, filter_avg = selection(slider_range, filter_values)
+                selected = index.frame(profiles)
+                if webgl:
+                    filter_plt = self._webgl_plot(selected)
+                else:
+                    filter_plt = px.line(selected, x=self.x, y=self.y, color=self.color, line_group=self.grouping,
+                                         hover_name=self.hover)
+                filter_avg_plt = px.line(filter_avg, x=self.x, y=self.y)
+                for fig in (filter_plt, filter_avg_plt):
+                    fig.update_layout(
+                        plot_bgcolor=color_palate["background"],
+                        paper_bgcolor=color_palate["paper"],
+                        font_color=color_palate["regular-text"]
+                    )
+                return filter_plt, filter_avg_plt
+
+        app.run_server(debug=True)
+        app.run_server(dev_tools_hot_reload=False)
+
+    def _filter_layout(self, df, color_palate):
+        """
+        Builds the filtered plot with its range slider and dropdowns.
+        :param df: profile data frame
+        :param color_palate: colors of the dashboard
+        :return: list of Dash components, empty if neither slider_column nor filter_columns were set
+        """
+        filters = [c for c in [self.slider_column] + self.filter_columns if c]
+        if not filters:
+            return []
+        controls = []
+        if self.slider_column:
+            low, high = float(df[self.slider_column].min()), float(df[self.slider_column].max())
+            controls.append(dcc.RangeSlider(
+                id="rangeslider",
+                min=low,
+                max=high,
+                value=[low, high],
+                step=(high - low) / 100 or None,
+                allowCross=False
+            ))
+        for column in self.filter_columns:
+            controls.append(dcc.Dropdown(
+                id="filter-dropdown-{}".format(column),
+                options=[{"label": str(v), "value": v} for v in sorted(df[column].unique().tolist())],
+                multi=True,
+                placeholder="All {}".format(column)
+            ))
+        return [
+            html.Div(children="{} filtered by {}".format(self.subtitle, ", ".join(filters)), style={
+                "color": color_palate["regular-text"]
+            }),
+            dcc.Graph(id="filter-plot"),
+            html.Div(controls),
+            dcc.Graph(id="filter-avg-plot")
+        ]
@@ -1,5 +1,36 @@
 # script for raster specific functions
 from osgeo import gdal
+from osgeo import gdal_array
+from osgeo import osr
+from collections import OrderedDict
+import hashlib
+import numpy as np
+import os
+
+# running totals of the ReadAsArray calls made by this module, used by the benchmarks and instrumentation
+read_counter = {"reads": 0, "pixels": 0, "bytes": 0}
+
+
+def reset_read_counter():
+    """
+    function to zero the read counter
+    :return: the counts before they were reset
+    """
+    counts = dict(read_counter)
+    for key in read_counter:
+        read_counter[key] = 0
+    return counts
+
+
+def _count_read(array):
+    """
+    helper to add one ReadAsArray result to the read counter
+    :param array: array returned by ReadAsArray, None if the read failed
+    """
+    read_counter["reads"] += 1
+    if array is not None:
+        read_counter["pixels"] += array.size
+        read_counter["bytes"] += array.nbytes
 
 
 def offset(x, y, x_origin, y_origin, pix_width, pix_height):
@@ -40,6 +71,7 @@ def pixel_values(x, y, source):
     px_offset = offset(x, y, x_org, y_org, pix_w, pix_h)
 
     val = band.ReadAsArray(px_offset[0], px_offset[1], 1, 1)
+    _count_read(val)
 
     try:
         pixel_val.append(*val)
@@ -51,3 +83,454 @@ def pixel_values(x, y, source):
         print("No data for point ({}, {})".format(px_offset[0], px_offset[1]))
     else:
         return pixel_val
+
+
+def pixel_offsets(x, y, geo_trans):
+    """
+    vectorized version of offset for arrays of coordinates. Pixel indices are floored rather than truncated so that
+    points just outside the top or left edge of the raster are not mapped onto the first row/column.
+    :param x: array of x-coordinates
+    :param y: array of y-coordinates
+    :param geo_trans: geotransform of input raster (from GetGeoTransform())
+    :return: column and row offset arrays
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    cols = np.floor((x - geo_trans[0]) / geo_trans[1]).astype(np.int64)
+    rows = np.floor((y - geo_trans[3]) / geo_trans[5]).astype(np.int64)
+    return cols, rows
+
+
+def read_pixels(band, cols, rows, groups=None, max_window_pixels=4194304):
+    """
+    function to read the pixel values at arrays of column/row offsets with as few GDAL reads as possible.
+    Pixels are read through the bounding window of all points when it is small enough, otherwise through one window
+    per group (e.g. one per line) or per square tile of the raster. Groups whose own window is still too large (e.g.
+    long diagonal lines) are split into the same square tiles.
+    :param band: GDAL raster band
+    :param cols: array of column offsets
+    :param rows: array of row offsets
+    :param groups: optional array of group ids (same length as cols), each group is read through its own window,
+     or its own tiles when that window is larger than max_window_pixels
+    :param max_window_pixels: largest window (in pixels) read in a single ReadAsArray call
+    :return: values array (band data type) and boolean mask of the points that fall on the raster
+    """
+    cols = np.asarray(cols, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+    values = np.zeros(cols.shape, dtype=dtype)
+    valid = (cols >= 0) & (rows >= 0) & (cols < band.XSize) & (rows < band.YSize)
+    if not valid.any():
+        return values, valid
+
+    idx = np.flatnonzero(valid)
+    v_cols = cols[idx]
+    v_rows = rows[idx]
+    c_min, c_max = v_cols.min(), v_cols.max()
+    r_min, r_max = v_rows.min(), v_rows.max()
+    # square tiles of at most max_window_pixels pixels
+    tile = max(int(np.sqrt(max_window_pixels)), 1)
+    n_tiles = (band.YSize // tile + 1) * (band.XSize // tile + 1)
+    if (c_max - c_min + 1) * (r_max - r_min + 1) <= max_window_pixels:
+        keys = np.zeros(idx.shape, dtype=np.int64)
+    elif groups is not None:
+        _, keys = np.unique(np.asarray(groups)[idx], return_inverse=True)
+        keys = keys.ravel()
+        n_groups = int(keys.max()) + 1
+        g_c_min, g_c_max = np.full(n_groups, band.XSize), np.full(n_groups, -1)
+        g_r_min, g_r_max = np.full(n_groups, band.YSize), np.full(n_groups, -1)
+        np.minimum.at(g_c_min, keys, v_cols)
+        np.maximum.at(g_c_max, keys, v_cols)
+        np.minimum.at(g_r_min, keys, v_rows)
+        np.maximum.at(g_r_max, keys, v_rows)
+        too_large = (g_c_max - g_c_min + 1) * (g_r_max - g_r_min + 1) > max_window_pixels
+        if too_large.any():
+            # the window of such a group grows with the square of its length, so it is read tile by tile instead
+            split = too_large[keys]
+            keys = keys * n_tiles
+            keys[split] += (v_rows[split] // tile) * (band.XSize // tile + 1) + v_cols[split] // tile
+    else:
+        keys = (v_rows // tile) * (band.XSize // tile + 1) + v_cols // tile
+
+    # sorting by key lets every window be served from one contiguous slice of the points
+    for part in _split_by_key(keys):
+        p_cols = v_cols[part]
+        p_rows = v_rows[part]
+        x_off, y_off = int(p_cols.min()), int(p_rows.min())
+        win = band.ReadAsArray(x_off, y_off, int(p_cols.max()) - x_off + 1, int(p_rows.max()) - y_off + 1)
+        _count_read(win)
+        values[idx[part]] = win[p_rows - y_off, p_cols - x_off]
+    return values, valid
+
+
+def point_transform(src_srs, dst_srs):
+    """
+    function to build a coordinate transformation between two spatial references that always works in x/y
+    (easting/northing, longitude/latitude) order regardless of the axis order of the CRS definitions.
+    :param src_srs: osr.SpatialReference of the input coordinates
+    :param dst_srs: osr.SpatialReference of the output coordinates
+    :return: osr.CoordinateTransformation
+    """
+    src_srs = src_srs.Clone()
+    dst_srs = dst_srs.Clone()
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):  # GDAL 3+
+        src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        dst_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return osr.CoordinateTransformation(src_srs, dst_srs)
+
+
+def reproject_points(x, y, transform):
+    """
+    function to transform arrays of coordinates in one batch
+    :param x: array of x-coordinates
+    :param y: array of y-coordinates
+    :param transform: osr.CoordinateTransformation (see point_transform)
+    :return: transformed x and y arrays
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.size == 0:
+        return x.copy(), y.copy()
+    out = np.array(transform.TransformPoints(np.column_stack([x, y]).tolist()), dtype=np.float64)
+    return out[:, 0], out[:, 1]
+
+
+def raster_bounds(source, transform=None, edge_points=21):
+    """
+    function to get the extent of a raster as a rectangle, optionally in another CRS. Points along every edge are
+    transformed so the rectangle still covers the raster when the edges curve in the target CRS.
+    :param source: target raster (GDAL raster object, need to gdal.Open() raster before inputting into function)
+    :param transform: optional raster to target CRS osr.CoordinateTransformation (see point_transform)
+    :param edge_points: number of points transformed along each edge
+    :return: (min x, min y, max x, max y)
+    """
+    geo_trans = source.GetGeoTransform()
+    steps = np.linspace(0.0, 1.0, edge_points)
+    cols = np.concatenate([steps, np.ones(edge_points), steps, np.zeros(edge_points)]) * source.RasterXSize
+    rows = np.concatenate([np.zeros(edge_points), steps, np.ones(edge_points), steps]) * source.RasterYSize
+    x = geo_trans[0] + cols * geo_trans[1] + rows * geo_trans[2]
+    y = geo_trans[3] + cols * geo_trans[4] + rows * geo_trans[5]
+    if transform is not None:
+        x, y = reproject_points(x, y, transform)
+    return x.min(), y.min(), x.max(), y.max()
+
+
+def warp_cache_path(raster_path, epsg, ext=None):
+    """
+    function to name the reprojected copy of a raster after a fingerprint of the source (path, size and modification
+    time) and target CRS, so a copy is only reused while the source file is unchanged.
+    :param raster_path: path to the source raster
+    :param epsg: target EPSG code
+    :param ext: extension of the copy, defaults to the extension of the source
+    :return: path of the reprojected copy, next to the source raster
+    """
+    stat = os.stat(raster_path)
+    key = "{}|{}|{}|{}".format(os.path.abspath(raster_path), stat.st_size, stat.st_mtime_ns, epsg)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    start_path, name = os.path.split(raster_path)
+    base, src_ext = os.path.splitext(name)
+    return os.path.join(start_path, "EPSG_{}_{}_{}{}".format(epsg, digest, base, src_ext if ext is None else ext))
+
+
+def _file_stamp(path):
+    """
+    helper to get the size and modification time of a file, through GDAL's virtual file systems (/vsizip/,
+    /vsicurl/, ...) when it is not a local file
+    :param path: file path
+    :return: (size, modification time) or None if the file can not be found
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    stat = gdal.VSIStatL(path)
+    return None if stat is None else (stat.size, stat.mtime)
+
+
+def raster_fingerprint(raster_path, source):
+    """
+    function to describe a raster by its path, geotransform and the size and modification time of its files
+    (GetFileList(), which also covers /vsizip/, /vsicurl/ and subdataset rasters), which change whenever the raster
+    is replaced or edited
+    :param raster_path: path (or GDAL dataset name) of the raster
+    :param source: the opened raster (GDAL raster object)
+    :return: fingerprint string, or None for rasters without files (e.g. MEM datasets) whose changes can not be seen
+    """
+    stamps = []
+    for path in source.GetFileList() or []:
+        stamp = _file_stamp(path)
+        if stamp is not None:
+            stamps.append("{}:{}:{}".format(os.path.abspath(path) if os.path.isfile(path) else path, *stamp))
+    if not stamps:
+        return None
+    name = os.path.abspath(raster_path) if os.path.isfile(raster_path) else raster_path
+    return "|".join([name] + stamps + [",".join(repr(float(v)) for v in source.GetGeoTransform())])
+
+
+def _split_by_key(keys):
+    """
+    helper to split point indices into runs of equal keys
+    :param keys: array of integer keys, one per point
+    :return: list of index arrays, one per unique key
+    """
+    order = np.argsort(keys, kind="stable")
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    return np.split(order, bounds)
+
+
+def batch_pixel_values(x, y, source, groups=None, max_window_pixels=4194304, cache=None):
+    """
+    function to get pixel values from raster for arrays of points, the batch counterpart of pixel_values.
+    The geotransform and band are only looked up once and the pixels are read in bulk (see read_pixels).
+    :param x: array of x-coordinates
+    :param y: array of y-coordinates
+    :param source: target raster (GDAL raster object, need to gdal.Open() raster before inputting into function)
+    :param groups: optional array of group ids used to split the reads, e.g. the line each point belongs to
+    :param max_window_pixels: largest window (in pixels) read in a single ReadAsArray call
+    :param cache: optional BlockCache for the raster, pixels are then served from cached blocks instead of windows
+    :return: values array and boolean mask, False where the point is off the raster
+    """
+    geo_trans = source.GetGeoTransform()
+    cols, rows = pixel_offsets(x, y, geo_trans)
+    if cache is not None:
+        return cache.read_pixels(cols, rows)
+    band = source.GetRasterBand(1)
+    return read_pixels(band, cols, rows, groups=groups, max_window_pixels=max_window_pixels)
+
+
+class BlockCache:
+    """
+    A bounded LRU cache of raster blocks for rasters too large to read whole. Blocks are read in the native block
+    size of the band (GetBlockSize()) so reads line up with how GDAL stores the data, and the least recently used
+    blocks are dropped once the cache holds more than max_mb megabytes.
+    """
+
+    def __init__(self, source, band_num=1, max_mb=256):
+        """
+        :param source: target raster (GDAL raster object, need to gdal.Open() raster before inputting into function)
+        :param band_num: band to read from
+        :param max_mb: memory limit of the cache in megabytes
+        """
+        self.source = source  # keeps the dataset open for as long as the cache holds its band
+        self.band = source.GetRasterBand(band_num)
+        self.block_w, self.block_h = self.band.GetBlockSize()
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.blocks = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_block(self, block_x, block_y):
+        """
+        Returns a block from the cache, reading it from disk (and evicting old blocks if needed) on a miss.
+        :param block_x: block column
+        :param block_y: block row
+        :return: block array, edge blocks are cropped to the raster size
+        """
+        key = (block_x, block_y)
+        block = self.blocks.get(key)
+        if block is not None:
+            self.blocks.move_to_end(key)
+            self.hits += 1
+            return block
+        self.misses += 1
+        x_off = block_x * self.block_w
+        y_off = block_y * self.block_h
+        block = self.band.ReadAsArray(x_off, y_off, min(self.block_w, self.band.XSize - x_off),
+                                      min(self.block_h, self.band.YSize - y_off))
+        _count_read(block)
+        self.blocks[key] = block
+        self.nbytes += block.nbytes
+        while self.nbytes > self.max_bytes and len(self.blocks) > 1:
+            _, old = self.blocks.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return block
+
+    def read_pixels(self, cols, rows):
+        """
+        Cached counterpart of read_pixels, every point is served from the block it falls in.
+        :param cols: array of column offsets
+        :param rows: array of row offsets
+        :return: values array (band data type) and boolean mask of the points that fall on the raster
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(self.band.DataType)
+        values = np.zeros(cols.shape, dtype=dtype)
+        valid = (cols >= 0) & (rows >= 0) & (cols < self.band.XSize) & (rows < self.band.YSize)
+        idx = np.flatnonzero(valid)
+        if idx.size == 0:
+            return values, valid
+
+        block_x = cols[idx] // self.block_w
+        block_y = rows[idx] // self.block_h
+        n_block_x = -(-self.band.XSize // self.block_w)
+        for part in _split_by_key(block_y * n_block_x + block_x):
+            p_idx = idx[part]
+            b_x, b_y = int(block_x[part[0]]), int(block_y[part[0]])
+            block = self.get_block(b_x, b_y)
+            values[p_idx] = block[rows[p_idx] - b_y * self.block_h, cols[p_idx] - b_x * self.block_w]
+        return values, valid
+
+    def stats(self):
+        """
+        :return: dictionary of cache hit/miss counts and current size
+        """
+        return {"hits": self.hits, "misses": self.misses, "blocks": len(self.blocks), "bytes": self.nbytes}
+
+
+# status codes returned by sample_pixel_values for every point
+SAMPLE_OK = 0
+SAMPLE_OFF_RASTER = 1
+SAMPLE_NODATA = 2
+SAMPLE_EXCLUDED = 3
+SAMPLE_STATUS_NAMES = {SAMPLE_OFF_RASTER: "off raster", SAMPLE_NODATA: "no data", SAMPLE_EXCLUDED: "excluded value"}
+
+
+def _kernel_weights(frac, method):
+    """
+    helper to get the interpolation weights of the neighbouring pixels along one axis
+    :param frac: array of fractional positions between pixel centres
+    :param method: "bilinear" (2 neighbours) or "cubic" (4 neighbours, Keys kernel with a = -0.5)
+    :return: (n, k) array of weights, columns ordered from the lowest neighbour
+    """
+    if method == "bilinear":
+        return np.stack([1.0 - frac, frac], axis=1)
+    dist = np.abs(np.stack([frac + 1.0, frac, 1.0 - frac, 2.0 - frac], axis=1))
+    near = (1.5 * dist - 2.5) * dist ** 2 + 1.0
+    far = ((-0.5 * dist + 2.5) * dist - 4.0) * dist + 2.0
+    return np.where(dist <= 1.0, near, np.where(dist < 2.0, far, 0.0))
+
+
+def apply_scale(values, scale=1.0, offset=0.0):
+    """
+    function to convert raw pixel values to physical units (value * scale + offset). Decimal scale factors such as
+    0.1 are applied by dividing by their reciprocal so results like 23 * 0.1 stay exact (2.3).
+    :param values: array of raw values
+    :param scale: scale factor
+    :param offset: offset added after scaling
+    :return: scaled values (unchanged if scale is 1 and offset is 0)
+    """
+    if scale == 1 and offset == 0:
+        return values
+    inverse = 1.0 / scale if scale else 0.0
+    if inverse and abs(inverse - round(inverse)) < 1e-9:
+        values = values / round(inverse)
+    else:
+        values = values * scale
+    return values + offset if offset else values
+
+
+def sample_pixel_values(x, y, source, method="nearest", use_nodata=True, exclude_values=None, scale=None,
+                        offset=None, groups=None, max_window_pixels=4194304, cache=None):
+    """
+    function to sample a raster at arrays of points with NoData, excluded values and scale/offset handled as
+    vectorized masks rather than per point exceptions.
+    :param x: array of x-coordinates
+    :param y: array of y-coordinates
+    :param source: target raster (GDAL raster object, need to gdal.Open() raster before inputting into function)
+    :param method: "nearest", "bilinear" or "cubic", interpolation is done between pixel centres on whole arrays
+     and neighbours beyond the raster edge repeat the edge pixels
+    :param use_nodata: drop points whose pixel (or any interpolation neighbour) equals band.GetNoDataValue()
+    :param exclude_values: raw pixel values to drop as well, e.g. (0,) for unburned TIR pixels
+    :param scale: scale factor for the values, None to use band.GetScale()
+    :param offset: offset for the values, None to use band.GetOffset()
+    :param groups: optional array of group ids used to split the reads, e.g. the line each point belongs to
+    :param max_window_pixels: largest window (in pixels) read in a single ReadAsArray call
+    :param cache: optional BlockCache for the raster
+    :return: values array (scaled) and status array (SAMPLE_OK or the reason the point was dropped)
+    """
+    geo_trans = source.GetGeoTransform()
+    band = source.GetRasterBand(1)
+    scale = band.GetScale() if scale is None else scale
+    offset = band.GetOffset() if offset is None else offset
+    cols, rows = pixel_offsets(x, y, geo_trans)
+    on_raster = (cols >= 0) & (rows >= 0) & (cols < band.XSize) & (rows < band.YSize)
+
+    if method == "nearest":
+        taps = np.ones((cols.size, 1))
+        tap_cols, tap_rows = cols[:, None], rows[:, None]
+    elif method in ("bilinear", "cubic"):
+        # fractional pixel position relative to pixel centres
+        u = (np.asarray(x, dtype=np.float64) - geo_trans[0]) / geo_trans[1] - 0.5
+        v = (np.asarray(y, dtype=np.float64) - geo_trans[3]) / geo_trans[5] - 0.5
+        col0, row0 = np.floor(u).astype(np.int64), np.floor(v).astype(np.int64)
+        w_col, w_row = _kernel_weights(u - col0, method), _kernel_weights(v - row0, method)
+        k = w_col.shape[1]
+        shift = np.arange(k) - (k // 2 - 1)
+        taps = (w_row[:, :, None] * w_col[:, None, :]).reshape(cols.size, k * k)
+        tap_cols = np.clip((col0[:, None] + shift)[:, None, :].repeat(k, axis=1).reshape(-1, k * k), 0,
+                           band.XSize - 1)
+        tap_rows = np.clip((row0[:, None] + shift)[:, :, None].repeat(k, axis=2).reshape(-1, k * k), 0,
+                           band.YSize - 1)
+    else:
+        raise ValueError("Unknown resampling method: {}".format(method))
+
+    # only points on the raster are read, each with all of its interpolation neighbours
+    n_taps = taps.shape[1]
+    idx = np.flatnonzero(on_raster)
+    tap_groups = None if groups is None else np.repeat(np.asarray(groups)[idx], n_taps)
+    if cache is not None:
+        raw, _ = cache.read_pixels(tap_cols[idx].ravel(), tap_rows[idx].ravel())
+    else:
+        raw, _ = read_pixels(band, tap_cols[idx].ravel(), tap_rows[idx].ravel(), groups=tap_groups,
+                             max_window_pixels=max_window_pixels)
+    raw = raw.reshape(idx.size, n_taps)
+
+    status = np.full(cols.shape, SAMPLE_OFF_RASTER, dtype=np.uint8)
+    status[idx] = SAMPLE_OK
+    used = taps[idx] != 0
+    if exclude_values is not None and len(exclude_values):
+        excluded = np.any(np.isin(raw, exclude_values) & used, axis=1)
+        status[idx[excluded]] = SAMPLE_EXCLUDED
+    nodata = band.GetNoDataValue() if use_nodata else None
+    if nodata is not None:
+        is_nodata = np.isnan(raw) if np.isnan(nodata) else raw == nodata
+        status[idx[np.any(is_nodata & used, axis=1)]] = SAMPLE_NODATA
+
+    if method == "nearest":
+        values = np.zeros(cols.shape, dtype=raw.dtype)
+        values[idx] = raw[:, 0]
+    else:
+        values = np.zeros(cols.shape, dtype=np.float64)
+        values[idx] = np.sum(np.where(used, raw, 0) * taps[idx], axis=1)
+    return apply_scale(values, 1.0 if scale is None else scale, 0.0 if offset is None else offset), status
+
+
+def sample_summary(status):
+    """
+    function to count the dropped points by reason
+    :param status: status array from sample_pixel_values
+    :return: dictionary of reason name to number of points
+    """
+    counts = np.bincount(status, minlength=len(SAMPLE_STATUS_NAMES) + 1)
+    return {name: int(counts[code]) for code, name in SAMPLE_STATUS_NAMES.items()}
+
+
+def swath_statistics(values, valid, stats=("mean", "median", "max")):
+    """
+    function to reduce the samples across a swath to one value per point, ignoring dropped samples
+    :param values: (points, offsets) array of sampled values
+    :param valid: (points, offsets) mask of the samples to use (e.g. status == SAMPLE_OK)
+    :param stats: statistics to compute, any of "mean", "median", "min", "max" and "std"
+    :return: dictionary of "swath_<stat>" to arrays (NaN where a swath has no valid samples) plus "swath_count"
+    """
+    values = np.asarray(values, dtype=np.float64)
+    count = valid.sum(axis=1)
+    has = count > 0
+    columns = {}
+    for stat in stats:
+        out = np.full(count.shape, np.nan)
+        if stat == "mean":
+            out[has] = np.where(valid, values, 0.0).sum(axis=1)[has] / count[has]
+        elif stat == "max":
+            out[has] = np.where(valid, values, -np.inf).max(axis=1)[has]
+        elif stat == "min":
+            out[has] = np.where(valid, values, np.inf).min(axis=1)[has]
+        elif stat in ("median", "std"):
+            masked = np.where(valid, values, np.nan)[has]
+            out[has] = np.nanmedian(masked, axis=1) if stat == "median" else np.nanstd(masked, axis=1)
+        else:
+            raise ValueError("Unknown swath statistic: {}".format(stat))
+        columns["swath_" + stat] = out
+    columns["swath_count"] = count
+    return columns
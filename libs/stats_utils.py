@@ -0,0 +1,187 @@
+# script for running statistics of extracted profiles
+import numpy as np
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class ProfileStats:
+    """
+    Running statistics of pixel values per group (e.g. front) and distance bin, updated batch by batch so average
+    and percentile profiles are kept in a small table instead of being recomputed from every sample.
+    Count, mean and variance are merged with the parallel form of Welford's algorithm (Chan et al., 1979), and
+    percentiles come from a fixed-range histogram sketch, accurate to one histogram bin for values inside
+    value_range. Values outside it (e.g. resampling overshoot) are counted in two tail bins that reach to the exact
+    min/max of their distance bin, so they never pile up in the edge bins of the histogram.
+    """
+
+    def __init__(self, bin_width, value_range, group_name="front_start", n_hist_bins=256):
+        """
+        :param bin_width: width of the distance bins, usually the point spacing
+        :param value_range: (min, max) of the values, e.g. the raster minimum/maximum, used for the histogram sketch
+        :param group_name: name of the group column in the output table
+        :param n_hist_bins: number of histogram bins per distance bin
+        """
+        self.bin_width = int(bin_width) if float(bin_width).is_integer() else bin_width
+        self.low, self.high = float(value_range[0]), float(value_range[1])
+        if not self.high > self.low:
+            self.high = self.low + 1.0
+        self.group_name = group_name
+        self.n_hist_bins = n_hist_bins
+        self.slots = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.below = np.zeros(0, dtype=np.int64)
+        self.above = np.zeros(0, dtype=np.int64)
+        self.hist = np.zeros((0, n_hist_bins), dtype=np.int64)
+
+    def _slot_ids(self, groups, bins):
+        """
+        Maps (group, distance bin) pairs to rows of the statistics arrays, adding rows for new pairs.
+        :param groups: array of group labels
+        :param bins: array of distance bin numbers
+        :return: array of row numbers
+        """
+        labels, group_codes = np.unique(np.asarray(groups).astype(str), return_inverse=True)
+        pairs, inverse = np.unique(np.stack([group_codes.ravel(), bins]), axis=1, return_inverse=True)
+        ids = np.empty(pairs.shape[1], dtype=np.int64)
+        for k, (code, b) in enumerate(pairs.T):
+            key = (labels[code], int(b))
+            if key not in self.slots:
+                self.slots[key] = len(self.slots)
+            ids[k] = self.slots[key]
+        self._grow(len(self.slots))
+        return ids[inverse.ravel()]
+
+    def _grow(self, size):
+        """
+        Extends the statistics arrays to size rows.
+        :param size: number of rows needed
+        """
+        extra = size - self.count.size
+        if extra <= 0:
+            return
+        self.count = np.append(self.count, np.zeros(extra, dtype=np.int64))
+        self.mean = np.append(self.mean, np.zeros(extra))
+        self.m2 = np.append(self.m2, np.zeros(extra))
+        self.min = np.append(self.min, np.full(extra, np.inf))
+        self.max = np.append(self.max, np.full(extra, -np.inf))
+        self.below = np.append(self.below, np.zeros(extra, dtype=np.int64))
+        self.above = np.append(self.above, np.zeros(extra, dtype=np.int64))
+        self.hist = np.vstack([self.hist, np.zeros((extra, self.n_hist_bins), dtype=np.int64)])
+
+    def update(self, groups, distances, values):
+        """
+        Adds a batch of samples.
+        :param groups: array of group labels, one per sample
+        :param distances: array of distances along the line
+        :param values: array of pixel values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        bins = np.floor(np.asarray(distances, dtype=np.float64) / self.bin_width).astype(np.int64)
+        slots = self._slot_ids(groups, bins)
+        size = self.count.size
+
+        # statistics of the batch, then merged into the running ones
+        b_count = np.bincount(slots, minlength=size)
+        b_mean = np.bincount(slots, values, size) / np.maximum(b_count, 1)
+        b_m2 = np.bincount(slots, (values - b_mean[slots]) ** 2, size)
+        total = self.count + b_count
+        delta = b_mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(b_count > 0, self.mean + delta * b_count / total, self.mean)
+            self.m2 = np.where(b_count > 0, self.m2 + b_m2 + delta ** 2 * self.count * b_count / total, self.m2)
+        self.count = total
+        np.minimum.at(self.min, slots, values)
+        np.maximum.at(self.max, slots, values)
+
+        below = values < self.low
+        above = values > self.high
+        np.add.at(self.below, slots[below], 1)
+        np.add.at(self.above, slots[above], 1)
+        inside = ~(below | above)
+        hist_bins = ((values[inside] - self.low) / (self.high - self.low) * self.n_hist_bins).astype(np.int64)
+        np.add.at(self.hist, (slots[inside], np.minimum(hist_bins, self.n_hist_bins - 1)), 1)
+
+    def quantiles(self, hist, below, above, low, high, qs=QUANTILES):
+        """
+        Approximate quantiles from histogram rows, interpolating linearly inside the histogram bin. The values below
+        and above the histogram range form two more bins, reaching down to low and up to high.
+        :param hist: (rows, n_hist_bins) histogram counts
+        :param below: array of the number of values below the histogram range, one per row
+        :param above: array of the number of values above the histogram range, one per row
+        :param low: array of the minimum value of each row
+        :param high: array of the maximum value of each row
+        :param qs: quantiles to compute, between 0 and 1
+        :return: (rows, len(qs)) array
+        """
+        n_rows = hist.shape[0]
+        counts = np.hstack([below[:, None], hist, above[:, None]])
+        edges = np.broadcast_to(np.linspace(self.low, self.high, self.n_hist_bins + 1), (n_rows, self.n_hist_bins + 1))
+        left = np.hstack([np.where(below > 0, low, self.low)[:, None], edges])
+        right = np.hstack([edges, np.where(above > 0, high, self.high)[:, None]])
+        cum = np.cumsum(counts, axis=1)
+        total = cum[:, -1:]
+        out = np.zeros((n_rows, len(qs)))
+        for k, q in enumerate(qs):
+            target = q * total
+            b = np.minimum((cum < target).sum(axis=1), counts.shape[1] - 1)[:, None]
+            in_bin = np.take_along_axis(counts, b, 1)
+            before = np.take_along_axis(cum, b, 1) - in_bin
+            frac = np.divide(target - before, in_bin, out=np.zeros(before.shape, dtype=np.float64), where=in_bin > 0)
+            b_left = np.take_along_axis(left, b, 1)
+            out[:, k] = (b_left + frac * (np.take_along_axis(right, b, 1) - b_left))[:, 0]
+        return out
+
+    def table(self, qs=QUANTILES, overall="all"):
+        """
+        The statistics as columns, one row per group and distance bin plus rows merging every group.
+        :param qs: quantiles to include, as p05, p25, ... columns
+        :param overall: group label of the merged rows, None to leave them out
+        :return: dictionary of column name to array, sorted by group and distance
+        """
+        keys = sorted(self.slots, key=lambda k: (k[0], k[1]))
+        rows = np.array([self.slots[k] for k in keys], dtype=np.int64)
+        groups = [k[0] for k in keys]
+        bins = np.array([k[1] for k in keys], dtype=np.int64)
+        count, mean, m2 = self.count[rows], self.mean[rows], self.m2[rows]
+        low, high, hist = self.min[rows], self.max[rows], self.hist[rows]
+        below, above = self.below[rows], self.above[rows]
+
+        if overall is not None and rows.size:
+            # merges the groups of every distance bin with the same parallel update
+            all_bins, inverse = np.unique(bins, return_inverse=True)
+            n = all_bins.size
+            a_count = np.bincount(inverse, count, n)
+            a_mean = np.bincount(inverse, mean * count, n) / np.maximum(a_count, 1)
+            a_m2 = np.bincount(inverse, m2 + count * (mean - a_mean[inverse]) ** 2, n)
+            a_min = np.full(n, np.inf)
+            a_max = np.full(n, -np.inf)
+            np.minimum.at(a_min, inverse, low)
+            np.maximum.at(a_max, inverse, high)
+            a_hist = np.zeros((n, self.n_hist_bins), dtype=np.int64)
+            np.add.at(a_hist, inverse, hist)
+            a_below = np.bincount(inverse, below, n).astype(np.int64)
+            a_above = np.bincount(inverse, above, n).astype(np.int64)
+            groups = groups + [overall] * n
+            bins = np.concatenate([bins, all_bins])
+            count = np.concatenate([count, a_count.astype(np.int64)])
+            mean = np.concatenate([mean, a_mean])
+            m2 = np.concatenate([m2, a_m2])
+            low = np.concatenate([low, a_min])
+            high = np.concatenate([high, a_max])
+            hist = np.vstack([hist, a_hist])
+            below = np.concatenate([below, a_below])
+            above = np.concatenate([above, a_above])
+
+        var = np.divide(m2, count - 1, out=np.zeros(m2.shape), where=count > 1)
+        columns = {self.group_name: np.array(groups, dtype=object), "distance": bins * self.bin_width,
+                   "count": count, "mean": mean, "var": var, "std": np.sqrt(var), "min": low, "max": high,
+                   "out_of_range": below + above}
+        for q, values in zip(qs, self.quantiles(hist, below, above, low, high, qs).T):
+            columns["p{:02d}".format(int(round(q * 100)))] = values
+        return columns
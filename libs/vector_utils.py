@@ -0,0 +1,206 @@
+# script for vector specific functions
+from osgeo import ogr
+import numpy as np
+
+
+def line_vertices(geom):
+    """
+    function to get the vertices of a line geometry as an array. Multi-part lines are merged into a single line
+    where their parts connect.
+    :param geom: OGR line geometry (from GetGeometryRef())
+    :return: (n, 2) array of vertex x,y coordinates
+    """
+    if ogr.GT_Flatten(geom.GetGeometryType()) == ogr.wkbMultiLineString:
+        geom = ogr.ForceToLineString(geom)
+    points = geom.GetPoints() or []
+    return np.array([pt[:2] for pt in points], dtype=np.float64).reshape(-1, 2)
+
+
+def _segmented_cumsum(values, first, counts):
+    """
+    helper for a cumulative sum restarting at every line. Lines are bucketed by vertex count into padded 2D arrays
+    and summed row by row, so each line's sums come out exactly as if it were summed on its own.
+    :param values: array of values, the values of each line stored contiguously
+    :param first: index of each line's first value
+    :param counts: number of values of each line
+    :return: array of the cumulative sums
+    """
+    out = np.zeros(values.shape, dtype=np.float64)
+    buckets = np.ceil(np.log2(np.maximum(counts, 1))).astype(np.int64)
+    for bucket in np.unique(buckets[counts > 0]):
+        sel = np.flatnonzero((buckets == bucket) & (counts > 0))
+        col = np.arange(counts[sel].max())
+        inside = col < counts[sel][:, None]
+        idx = (first[sel][:, None] + col)[inside]
+        grid = np.zeros(inside.shape, dtype=np.float64)
+        grid[inside] = values[idx]
+        out[idx] = np.cumsum(grid, axis=1)[inside]
+    return out
+
+
+def _line_arrays(lines):
+    """
+    helper to flatten a list of lines into vertex arrays with cumulative distances. Distances are measured from the
+    start of each line on its own, so a line's interpolated points do not depend on the other lines in the list.
+    :param lines: list of (n, 2) vertex arrays, one per line
+    :return: vertices, segment lengths (one per vertex, 0 for the last vertex of each line), distance of every vertex
+     from the start of its line, line of every vertex, index of each line's first vertex and vertex counts
+    """
+    n_lines = len(lines)
+    n_verts = np.array([len(v) for v in lines], dtype=np.int64)
+    verts = np.concatenate([np.asarray(v, dtype=np.float64).reshape(-1, 2) for v in lines])
+    vert_line = np.repeat(np.arange(n_lines), n_verts)
+
+    # segment lengths, with the "segment" joining one line to the next zeroed out
+    seg_len = np.hypot(np.diff(verts[:, 0]), np.diff(verts[:, 1]))
+    seg_len[vert_line[1:] != vert_line[:-1]] = 0.0
+    first = np.concatenate([[0], np.cumsum(n_verts)[:-1]])
+    vert_dist = _segmented_cumsum(np.concatenate([[0.0], seg_len]), first, n_verts)
+    seg_len = np.append(seg_len, 0.0)
+    return verts, seg_len, vert_dist, vert_line, first, n_verts
+
+
+def clip_to_rect(lines, rect):
+    """
+    function to find the part of every line that lies inside a rectangle (e.g. the raster extent), clipping each
+    segment with the Liang-Barsky algorithm in one vectorized pass. Distances are measured along the full line, so
+    clipped lines can be densified without moving their points (see densify_lines).
+    :param lines: list of (n, 2) vertex arrays, one per line
+    :param rect: (min x, min y, max x, max y)
+    :return: arrays of the first and last distance along each line inside the rectangle, inf/-inf if the line misses
+    """
+    n_lines = len(lines)
+    lo = np.full(n_lines, np.inf)
+    hi = np.full(n_lines, -np.inf)
+    n_verts = np.array([len(v) for v in lines], dtype=np.int64)
+    if n_lines == 0 or n_verts.sum() == 0:
+        return lo, hi
+    verts, seg_len, vert_dist, vert_line, first, n_verts = _line_arrays(lines)
+    # every vertex except the last of each line starts a segment
+    seg = np.flatnonzero(np.arange(verts.shape[0]) < (first + n_verts - 1)[vert_line])
+    x0, y0 = verts[seg, 0], verts[seg, 1]
+    dx, dy = verts[seg + 1, 0] - x0, verts[seg + 1, 1] - y0
+    p = np.stack([-dx, dx, -dy, dy])
+    q = np.stack([x0 - rect[0], rect[2] - x0, y0 - rect[1], rect[3] - y0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = q / p
+    t0 = np.max(np.where(p < 0, ratio, 0.0), axis=0)
+    t1 = np.min(np.where(p > 0, ratio, 1.0), axis=0)
+    inside = (t0 <= t1) & ~np.any((p == 0) & (q < 0), axis=0)
+
+    np.minimum.at(lo, vert_line[seg][inside], (vert_dist[seg] + t0 * seg_len[seg])[inside])
+    np.maximum.at(hi, vert_line[seg][inside], (vert_dist[seg] + t1 * seg_len[seg])[inside])
+    return lo, hi
+
+
+def densify_lines(lines, spacing, clip=None):
+    """
+    function to interpolate points along every line at a fixed spacing in a few vectorized operations. Points are
+    placed from the start of each line at 0, spacing, 2 * spacing, ... up to (but not including) the whole-unit length
+    of the line, following cumulative segment lengths so lines with any number of vertices are sampled correctly.
+    :param lines: list of (n, 2) vertex arrays, one per line (see line_vertices)
+    :param spacing: distance between interpolated points, does not need to be an integer
+    :param clip: optional (first, last) distance arrays from clip_to_rect, only points between them are created
+    :return: arrays of line index, distance along the line, x and y for every interpolated point
+    """
+    spacing = abs(spacing)
+    if float(spacing).is_integer():  # keeps integer distances for integer spacing
+        spacing = int(spacing)
+    n_lines = len(lines)
+    n_verts = np.array([len(v) for v in lines], dtype=np.int64)
+    if n_lines == 0 or n_verts.sum() == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=type(spacing)), empty, empty.copy()
+    verts, seg_len, vert_dist, vert_line, first, n_verts = _line_arrays(lines)
+    lengths = np.where(n_verts > 0, vert_dist[np.maximum(first + n_verts - 1, 0)], 0.0)
+
+    # first and one past the last step of every line
+    step_start = np.zeros(n_lines, dtype=np.int64)
+    step_end = np.ceil(np.floor(lengths) / spacing).astype(np.int64)
+    if clip is not None:
+        lo, hi = clip
+        missed = ~(lo <= hi)
+        step_start = np.ceil(np.where(missed, 0.0, lo) / spacing).astype(np.int64)
+        step_end = np.minimum(step_end, np.floor(np.where(missed, -1.0, hi) / spacing).astype(np.int64) + 1)
+    counts = np.maximum(step_end - step_start, 0)
+    line_idx = np.repeat(np.arange(n_lines), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + step_start[line_idx]
+    dists = step * spacing
+
+    # locate the segment each point falls on; the segment containing a distance is the last vertex at or before it.
+    # complex numbers sort by real then imaginary part, so (line, distance) pairs are searched in one call
+    seg = np.searchsorted(vert_line + 1j * vert_dist, line_idx + 1j * dists, side="right") - 1
+    seg = np.clip(seg, first[line_idx], first[line_idx] + n_verts[line_idx] - 2)
+    seg_len = seg_len[seg]
+    t = np.divide(dists - vert_dist[seg], seg_len, out=np.zeros(dists.shape), where=seg_len > 0)
+    xs = verts[seg, 0] + t * (verts[seg + 1, 0] - verts[seg, 0])
+    ys = verts[seg, 1] + t * (verts[seg + 1, 1] - verts[seg, 1])
+    return line_idx, dists, xs, ys
+
+
+def spatial_chunks(x, y, chunk_size):
+    """
+    function to split lines into spatially coherent chunks. Lines are ordered along a Z-order (Morton) curve of their
+    mean point location and cut into consecutive runs, so each chunk covers a compact area of the raster.
+    :param x: array of x-coordinates representing each line (e.g. mean of its interpolated points)
+    :param y: array of y-coordinates representing each line
+    :param chunk_size: number of lines per chunk
+    :return: list of line index arrays, one per chunk
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.size == 0:
+        return []
+    cells = []
+    for v in (x, y):
+        span = v.max() - v.min()
+        cells.append(((v - v.min()) / span * 65535).astype(np.uint64) if span > 0 else np.zeros(v.shape, np.uint64))
+    keys = np.zeros(x.shape, dtype=np.uint64)
+    for bit in range(16):
+        keys |= ((cells[0] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        keys |= ((cells[1] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    order = np.argsort(keys, kind="stable")
+    chunk_size = max(int(chunk_size), 1)
+    return [order[i:i + chunk_size] for i in range(0, order.size, chunk_size)]
+
+
+def line_directions(lines, line_idx, dists):
+    """
+    function to get the direction of the lines at interpolated points, from the segment each point falls on
+    :param lines: list of (n, 2) vertex arrays, one per line
+    :param line_idx: array of the line each point belongs to (see densify_lines)
+    :param dists: array of distances along the line
+    :return: arrays of the x and y components of the unit direction at every point (0, 0 on zero length lines)
+    """
+    if len(line_idx) == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty.copy()
+    verts, seg_len, vert_dist, vert_line, first, n_verts = _line_arrays(lines)
+    seg = np.searchsorted(vert_line + 1j * vert_dist, line_idx + 1j * np.asarray(dists, dtype=np.float64),
+                          side="right") - 1
+    seg = np.clip(seg, first[line_idx], first[line_idx] + n_verts[line_idx] - 2)
+    # repeated vertices give zero length segments, the search above lands on the segment after them
+    seg_len = seg_len[seg]
+    dx = np.divide(verts[seg + 1, 0] - verts[seg, 0], seg_len, out=np.zeros(seg.shape), where=seg_len > 0)
+    dy = np.divide(verts[seg + 1, 1] - verts[seg, 1], seg_len, out=np.zeros(seg.shape), where=seg_len > 0)
+    return dx, dy
+
+
+def swath_points(xs, ys, dx, dy, width, spacing):
+    """
+    function to build the grid of points across a swath, perpendicular to the line at every interpolated point.
+    The offsets are symmetric and include 0, so the middle column is the interpolated point itself.
+    :param xs: array of x-coordinates of the interpolated points
+    :param ys: array of y-coordinates of the interpolated points
+    :param dx: x component of the unit line direction at every point (see line_directions)
+    :param dy: y component of the unit line direction at every point
+    :param width: full width of the swath
+    :param spacing: distance between points across the swath, usually the interpolation distance
+    :return: (points, offsets) arrays of x and y, and the offsets across the line (positive to the left)
+    """
+    half = int(np.floor(abs(width) / 2.0 / spacing + 1e-9))
+    offsets = np.arange(-half, half + 1) * spacing
+    # the left normal of direction (dx, dy) is (-dy, dx)
+    grid_x = np.asarray(xs, dtype=np.float64)[:, None] - np.asarray(dy)[:, None] * offsets
+    grid_y = np.asarray(ys, dtype=np.float64)[:, None] + np.asarray(dx)[:, None] * offsets
+    return grid_x, grid_y, offsets
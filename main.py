@@ -2,61 +2,68 @@
 # Email: kshennan1233@sdsu.edu
 # San Diego State University Department of Geography
 
- """General Notes: Ensure the spatial resolution of the input raster is an integer, otherwise the shapely interpolation
- package will not give consistent results. The local server may take a few seconds to start, try using Chrome if you
- encounter frequent "Unable to Connect" errors in browsers such as Firefox."""
+"""General Notes: The local server may take a few seconds to start, try using Chrome if you
+encounter frequent "Unable to Connect" errors in browsers such as Firefox.
 
-# sample usage below
+Extraction jobs are described in JSON config files (see libs/job_utils.load_jobs and jobs/example_jobs.json):
+    python main.py jobs/example_jobs.json              # extract every job
+    python main.py jobs/example_jobs.json --plot 2     # extract, then serve the dashboard of the second job
+    python main.py jobs/example_jobs.json --timing     # print startup and per-job times
+Only GDAL and NumPy are imported for extraction, pandas/plotly/dash are loaded for --plot alone, so many small jobs
+start quickly. Put many jobs in one file to pay the startup once. The dashboard server blocks until it is stopped,
+so --plot serves one job (numbered from 1 across all config files, which needs a plot section)."""
 
-from libs.general_utils import *
+import time
+
+START = time.perf_counter()
+
+import argparse
+import sys
 
 
 """____________________"""
 
 
-def main():
-    # create output directory
-    output = "output"
-    isdir = os.path.isdir(output)
-    if not isdir:
-        os.makedirs(output)
-
-    # Two plots are generated to display each possible outcome (TIR profiles or elevation profiles).
-    # Comment out one to see the other, as both can not be displayed at the same time.
-
-    ros_vect_elev = ProfileExtractor(shp_path="./data/shp/vectors_ep3.shp",
-                                     raster_path="./data/raster/DEM/USGS_NED_13_n35w120_IMG.img",
-                                     raster_driver_name="HFA", shp_id_field="vect_id",
-                                     shp_front_start_field="vect_front", shp_front_end_field="vect_fro_1",
-                                     csv_out_path="./output/ep3_elev_data.csv", desired_front=2, tir=True)
-
-    # ros_vect_elev.print_shp_fields()
-    # ros_vect_elev.extractor()
-
-    elev_line = Plotter(input_csv="./output/ep3_elev_data.csv", x="distance",
-                        y="pixel_val", color="line_id", grouping="line_id", hover="line_id",
-                        title="Elevation Profiles",
-                        subtitle="Thomas Fire Seq. 4 Ep. 3 Rate of Spread (ROS) Vector Elevation Profiles")
-    # Elevation Profile Plot
-    # elev_line.create_plot()
-
-    t1_profile = ProfileExtractor(shp_path="./data/shp/tir_th_seq4_forward_2_5k.shp",
-                                  raster_path="./data/raster/TIR/seq4_ep3/2017-12-09-030_IR3_083-te_10mpp.img",
-                                  raster_driver_name="HFA", shp_id_field="vect_id",
-                                  shp_front_start_field="front", desired_front=2,
-                                  csv_out_path="./output/ep3_tir_t1_data.csv", tir=True)
-
-    # t1_profile.print_shp_fields()
-    t1_profile.extractor()
-
-    th_ep3_t1_profiles = Plotter(input_csv="./output/ep3_tir_t1_data.csv", x="distance",
-                                 y="pixel_val", color="line_id", grouping="line_id", hover="line_id",
-                                 title="Thomas Fire Seq. 4 Ep. 3 Temperature Profiles",
-                                 subtitle="Temperature profiles in Advance of Active Front ")
-    # TIR Profile Plot
-    th_ep3_t1_profiles.create_plot()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract raster profiles along shapefile vectors")
+    parser.add_argument("configs", nargs="+", help="JSON job config files")
+    parser.add_argument("--plot", type=int, metavar="JOB",
+                        help="serve the dashboard of this job (numbered from 1) after extracting")
+    parser.add_argument("--workers", type=int, help="worker processes per job, overrides the config")
+    parser.add_argument("--print-fields", action="store_true", help="print the shapefile fields of each job and exit")
+    parser.add_argument("--timing", action="store_true", help="print startup and per-job times")
+    args = parser.parse_args(argv)
+
+    from libs.job_utils import load_jobs, build_extractor, run_job, plot_job
+    import libs.general_utils  # imported here so its cost is part of the reported startup time
+    startup = time.perf_counter() - START
+    if args.timing:
+        print("startup: {:.3f} s".format(startup))
+
+    jobs = [job for path in args.configs for job in load_jobs(path)]
+    if args.plot is not None:
+        if not 1 <= args.plot <= len(jobs):
+            parser.error("--plot {} is not a job number, the configs hold jobs 1 to {}".format(args.plot, len(jobs)))
+        if not jobs[args.plot - 1].get("plot"):
+            parser.error("job {} ({}) has no plot section".format(args.plot, jobs[args.plot - 1]["output"]))
+    if args.print_fields:
+        for job in jobs:
+            build_extractor(job).print_shp_fields()
+        return 0
+
+    for k, job in enumerate(jobs):
+        seconds = run_job(job, workers=args.workers)[0]
+        if args.timing:
+            print("job {}/{} ({}): {:.3f} s".format(k + 1, len(jobs), job["output"], seconds))
+    if args.timing:
+        print("total: {:.3f} s".format(time.perf_counter() - START))
+
+    if args.plot is not None:
+        plot_job(jobs[args.plot - 1])
+    return 0
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
 """____________________"""